@@ -1,46 +1,130 @@
 # agents.py
+import asyncio
+import threading
 from langchain_google_genai import ChatGoogleGenerativeAI
-from prompts import base_agent_prompt, mcp_controller_prompt
+from prompts import base_agent_prompt, mcp_controller_prompt, mcp_plan_prompt
+
+DEFAULT_MODEL = "models/gemini-1.5-pro"   # or flash for cheaper
+DEFAULT_CONCURRENCY = 4     # in-flight LLM calls per agent
+DEFAULT_TIMEOUT = 60.0      # seconds per LLM call
+
+# One chat client per (key, model) for the whole process, so every APIManager
+# shares the same underlying HTTP/gRPC connection pool
+_llm_pool = {}
+_llm_pool_lock = threading.Lock()
+
+
+def shared_llm(gemini_api_key: str, model: str = DEFAULT_MODEL):
+    with _llm_pool_lock:
+        llm = _llm_pool.get((gemini_api_key, model))
+        if llm is None:
+            # Wrap Gemini as an LLM for LangChain
+            llm = ChatGoogleGenerativeAI(model=model, google_api_key=gemini_api_key)
+            _llm_pool[(gemini_api_key, model)] = llm
+        return llm
+
 
 class AgentManager:
-    def __init__(self, gemini_api_key: str):
-        # Wrap Gemini as an LLM for LangChain
-        self.llm = ChatGoogleGenerativeAI(
-            model="models/gemini-1.5-pro",   # or flash for cheaper
-            google_api_key=gemini_api_key
-        )
+    def __init__(self, gemini_api_key: str, llm=None, timeout: float = DEFAULT_TIMEOUT):
+        self.llm = llm or shared_llm(gemini_api_key)
+        self.timeout = timeout
         self.agents = {}
+        self.controller_chain = mcp_controller_prompt | self.llm
+        self.planner_chain = mcp_plan_prompt | self.llm
+        self.controller_semaphore = asyncio.Semaphore(DEFAULT_CONCURRENCY)
 
-    def create_agent(self, name, role, task):
+    def create_agent(self, name, role, task, concurrency=DEFAULT_CONCURRENCY, timeout=None):
         """Registers an agent with a specific role/task"""
-        chain = self.llm | base_agent_prompt
+        chain = base_agent_prompt | self.llm
         # chain.verbose = True
         self.agents[name] = {
             "role": role,
             "task": task,
-            "chain": chain
+            "chain": chain,
+            "semaphore": asyncio.Semaphore(concurrency),
+            "timeout": timeout or self.timeout,
         }
         print(f"[AGENT] Created agent '{name}' with role={role}")
 
-    def run_agent(self, name, user_name, context):
-        """Executes prompt chain for agent"""
+    def _agent_inputs(self, name, user_name, context):
         if name not in self.agents:
             raise ValueError(f"Agent {name} not found")
         agent = self.agents[name]
-        response = agent["chain"].invoke(
-            role=agent["role"],
-            task=agent["task"],
-            user_name=user_name,
-            context=context
-        )
+        return agent, {
+            "role": agent["role"],
+            "task": agent["task"],
+            "user_name": user_name,
+            "context": context,
+        }
+
+    def run_agent(self, name, user_name, context):
+        """Executes prompt chain for agent (blocking - never call from the event loop)"""
+        agent, inputs = self._agent_inputs(name, user_name, context)
+        response = agent["chain"].invoke(inputs)
         return response
 
+    async def arun_agent(self, name, user_name, context):
+        """Async run_agent, limited by the agent's semaphore and timeout"""
+        agent, inputs = self._agent_inputs(name, user_name, context)
+        async with agent["semaphore"]:
+            return await asyncio.wait_for(agent["chain"].ainvoke(inputs), agent["timeout"])
+
+    async def astream_agent(self, name, user_name, context):
+        """Yield the agent's response text incrementally as tokens arrive"""
+        agent, inputs = self._agent_inputs(name, user_name, context)
+        # A producer task owns the concurrency slot and the timeout, so a slow
+        # consumer neither holds the slot nor spends the LLM's time budget
+        chunks = asyncio.Queue()
+
+        async def produce():
+            try:
+                async with agent["semaphore"]:
+                    async with asyncio.timeout(agent["timeout"]):
+                        async for chunk in agent["chain"].astream(inputs):
+                            text = getattr(chunk, "content", chunk)
+                            if text:
+                                chunks.put_nowait(text)
+            finally:
+                chunks.put_nowait(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (text := await chunks.get()) is not None:
+                yield text
+            await producer      # re-raises the timeout or the chain's error
+        finally:
+            producer.cancel()
+
     def coordinate_mcp(self, agent_name, goal, status):
         """Uses LLM to decide MCP orchestration steps"""
-        chain = self.llm | mcp_controller_prompt
-        response = chain.invoke(
-            agent_name=agent_name,
-            goal=goal,
-            status=status
-        )
-        return response
\ No newline at end of file
+        response = self.controller_chain.invoke({
+            "agent_name": agent_name,
+            "goal": goal,
+            "status": status
+        })
+        return response
+
+    async def acoordinate_mcp(self, agent_name, goal, status):
+        """Async coordinate_mcp, limited by the controller semaphore and timeout"""
+        async with self.controller_semaphore:
+            return await asyncio.wait_for(
+                self.controller_chain.ainvoke({
+                    "agent_name": agent_name,
+                    "goal": goal,
+                    "status": status
+                }),
+                self.timeout,
+            )
+
+    async def aplan_mcp(self, agent_name, goal, status):
+        """Ask the controller for the full handoff plan (JSON DAG of agent steps)"""
+        async with self.controller_semaphore:
+            return await asyncio.wait_for(
+                self.planner_chain.ainvoke({
+                    "agent_name": agent_name,
+                    "goal": goal,
+                    "status": status,
+                    "agents": ", ".join(f"{n} ({a['role']})" for n, a in self.agents.items()),
+                }),
+                self.timeout,
+            )
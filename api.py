@@ -1,22 +1,82 @@
 # api.py
 from agents import AgentManager
+from cache import ResponseCache, shared_cache
+from orchestrator import Orchestrator, parse_plan
 
 class APIManager:
-    def __init__(self, gemini_api_key):
-        self.agent_manager = AgentManager(gemini_api_key)
+    def __init__(self, gemini_api_key, llm=None, cache: ResponseCache = None):
+        # AgentManager reuses one process-wide LLM client unless one is injected
+        self.agent_manager = AgentManager(gemini_api_key, llm=llm)
+        self.cache = cache or shared_cache
 
         # Register sample specialized agents
         self.agent_manager.create_agent("scheduler", "Calendar Assistant", "Manage user calendar and set reminders")
         self.agent_manager.create_agent("study_coach", "Study Mentor", "Encourage focus and break-study balance")
         self.agent_manager.create_agent("wellness", "Wellness Buddy", "Suggest exercises, food, and calming habits")
 
+    def _request_key(self, agent_name, user_name, context):
+        agent = self.agent_manager.agents.get(agent_name, {})
+        return self.cache.make_key("agent", agent_name, agent.get("role"), agent.get("task"), context, user_name)
+
+    def _mcp_key(self, agent_name, goal, status):
+        return self.cache.make_key("mcp", agent_name, None, goal, status)
+
+    def _plan_key(self, agent_name, goal, status):
+        return self.cache.make_key("plan", agent_name, None, goal, status)
+
     def handle_request(self, agent_name, user_name, context):
-        """Route request to the right agent"""
-        return self.agent_manager.run_agent(agent_name, user_name, context)
+        """Route request to the right agent (cached, identical in-flight calls coalesced)"""
+        return self.cache.get_or_call(
+            self._request_key(agent_name, user_name, context),
+            lambda: self.agent_manager.run_agent(agent_name, user_name, context),
+        )
 
     def manage_mcp(self, agent_name, goal, status):
         """Coordinate agents in a MCP pipeline (handoffs, next step)"""
-        return self.agent_manager.coordinate_mcp(agent_name, goal, status)
+        return self.cache.get_or_call(
+            self._mcp_key(agent_name, goal, status),
+            lambda: self.agent_manager.coordinate_mcp(agent_name, goal, status),
+        )
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+    # Async variants - safe to await from the FastAPI event loop
+    async def ahandle_request(self, agent_name, user_name, context):
+        return await self.cache.aget_or_call(
+            self._request_key(agent_name, user_name, context),
+            lambda: self.agent_manager.arun_agent(agent_name, user_name, context),
+        )
+
+    def astream_request(self, agent_name, user_name, context):
+        """Async iterator of response text chunks"""
+        return self.agent_manager.astream_agent(agent_name, user_name, context)
+
+    async def amanage_mcp(self, agent_name, goal, status):
+        return await self.cache.aget_or_call(
+            self._mcp_key(agent_name, goal, status),
+            lambda: self.agent_manager.acoordinate_mcp(agent_name, goal, status),
+        )
+
+    async def arun_mcp_plan(self, agent_name, user_name, goal, status, max_parallel=4):
+        """Plan the whole MCP flow once, then run independent agent steps in parallel"""
+        plan = await self.amanage_plan(agent_name, goal, status)
+        try:
+            steps = parse_plan(plan, known_agents=self.agent_manager.agents)
+        except ValueError:
+            # Don't serve the same broken plan for the rest of the TTL
+            self.cache.discard(self._plan_key(agent_name, goal, status))
+            raise
+        report = await Orchestrator(self, max_parallel).run(steps, user_name)
+        print(f"[MCP] Plan done in {report.wall_time:.2f}s "
+              f"(critical path {report.critical_path_latency:.2f}s, serial {report.serial_latency:.2f}s)")
+        return report
+
+    async def amanage_plan(self, agent_name, goal, status):
+        return await self.cache.aget_or_call(
+            self._plan_key(agent_name, goal, status),
+            lambda: self.agent_manager.aplan_mcp(agent_name, goal, status),
+        )
 
     # Example external APIs stubs
     def add_event(self, title, time):
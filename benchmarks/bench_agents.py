@@ -0,0 +1,109 @@
+# benchmarks/bench_agents.py
+"""
+Throughput of AgentManager under concurrent calls against a local fake LLM.
+
+Compares the blocking `run_agent` (what the server used to call) with
+`arun_agent` / `astream_agent`, and reports the worst event-loop stall seen
+by a 10 ms ticker task while the calls run - the stall is what every live
+audio session would feel.
+
+Run from the repo root:
+    python -m benchmarks.bench_agents --calls 64 --latency 0.5
+"""
+import argparse
+import asyncio
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agents import AgentManager
+
+REPLY = "Sure, I have blocked out 25 minutes of focus time followed by a short walk."
+
+
+class FakeLLM(BaseChatModel):
+    """Chat model with fixed latency and word-by-word streaming, no network"""
+    latency: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=REPLY))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=REPLY))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        words = REPLY.split(" ")
+        for word in words:
+            await asyncio.sleep(self.latency / len(words))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+async def ticker(stop: asyncio.Event, worst: list):
+    t = time.perf_counter()
+    while True:
+        await asyncio.sleep(0.01)
+        # Measured on every wakeup, so the gap left by a blocking call counts even if it was the last one
+        now = time.perf_counter()
+        worst[0] = max(worst[0], now - t - 0.01)
+        t = now
+        if stop.is_set():
+            return
+
+
+async def measure(label, work, calls):
+    stop, worst = asyncio.Event(), [0.0]
+    tick = asyncio.create_task(ticker(stop, worst))
+    await asyncio.sleep(0)      # let the ticker start its first sleep before work() can block the loop
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    print(f"{label:<28} {calls / elapsed:>9.1f} calls/s {elapsed:>8.2f}s  worst loop stall {worst[0] * 1000:>8.1f} ms")
+
+
+async def main(args):
+    manager = AgentManager("unused", llm=FakeLLM(latency=args.latency))
+    manager.create_agent("scheduler", "Calendar Assistant", "Manage user calendar",
+                         concurrency=args.concurrency)
+    first_token = []
+
+    async def blocking():
+        for _ in range(args.calls):
+            manager.run_agent("scheduler", "Alex", "plan my afternoon")
+
+    async def concurrent():
+        await asyncio.gather(*(manager.arun_agent("scheduler", "Alex", "plan my afternoon")
+                               for _ in range(args.calls)))
+
+    async def streaming():
+        async def one():
+            start = time.perf_counter()
+            async for _ in manager.astream_agent("scheduler", "Alex", "plan my afternoon"):
+                if start:
+                    first_token.append(time.perf_counter() - start)
+                    start = None
+        await asyncio.gather(*(one() for _ in range(args.calls)))
+
+    if args.calls * args.latency <= 30:
+        await measure("run_agent (blocking)", blocking, args.calls)
+    await measure(f"arun_agent (limit {args.concurrency})", concurrent, args.calls)
+    await measure(f"astream_agent (limit {args.concurrency})", streaming, args.calls)
+    first_token.sort()
+    print(f"stream time-to-first-token p50 {first_token[len(first_token) // 2] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake LLM latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=8)
+    asyncio.run(main(parser.parse_args()))
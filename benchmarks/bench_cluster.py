@@ -0,0 +1,105 @@
+# benchmarks/bench_cluster.py
+"""
+Scaling benchmark for cluster.py: 1 -> N worker processes on one box.
+
+Each client connection runs a closed loop of `ping` messages padded with a
+base64 blob of typical frame size, so every message costs the worker a full
+JSON parse just like a real screen/video frame. Reported numbers are total
+messages/s and MB/s handled across the cluster.
+
+Run from the repo root:
+    python -m benchmarks.bench_cluster --max-workers 4 --clients 4 --conns 16
+"""
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _wait_for_port(port: int, timeout: float = 20.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"port {port} never came up")
+
+
+async def _client_conns(port: int, conns: int, payload: str, duration: float) -> int:
+    import websockets
+
+    async def one(i: int) -> int:
+        count = 0
+        uri = f"ws://127.0.0.1:{port}/ws?session_id=bench-{os.getpid()}-{i}"
+        async with websockets.connect(uri, max_size=None) as ws:
+            deadline = time.perf_counter() + duration
+            while time.perf_counter() < deadline:
+                await ws.send(json.dumps({"type": "ping", "t": count, "data": payload}))
+                await ws.recv()
+                count += 1
+        return count
+
+    return sum(await asyncio.gather(*(one(i) for i in range(conns))))
+
+
+def _client_proc(port, conns, payload, duration, out):
+    out.put(asyncio.run(_client_conns(port, conns, payload, duration)))
+
+
+def run_point(workers: int, args, payload: str) -> float:
+    cluster = subprocess.Popen(
+        [sys.executable, "cluster.py", "--workers", str(workers), "--host", "127.0.0.1",
+         "--port", str(args.port), "--backend-port", str(args.backend_port)],
+        cwd=ROOT,
+    )
+    try:
+        for i in range(workers):
+            _wait_for_port(args.backend_port + i)
+        _wait_for_port(args.port)
+
+        ctx = multiprocessing.get_context("spawn")
+        out = ctx.Queue()
+        procs = [
+            ctx.Process(target=_client_proc, args=(args.port, args.conns, payload, args.duration, out))
+            for _ in range(args.clients)
+        ]
+        for p in procs:
+            p.start()
+        total = sum(out.get() for _ in procs)
+        for p in procs:
+            p.join()
+        return total / args.duration
+    finally:
+        cluster.terminate()
+        cluster.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--clients", type=int, default=4, help="client processes")
+    parser.add_argument("--conns", type=int, default=16, help="connections per client process")
+    parser.add_argument("--frame-kb", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--backend-port", type=int, default=9800)
+    args = parser.parse_args()
+
+    payload = base64.b64encode(os.urandom(args.frame_kb * 1024 * 3 // 4)).decode()
+    baseline = None
+    print(f"{'workers':>8} {'msg/s':>10} {'MB/s':>8} {'speedup':>8}")
+    workers = 1
+    while workers <= args.max_workers:
+        rate = run_point(workers, args, payload)
+        baseline = baseline or rate
+        print(f"{workers:>8} {rate:>10.0f} {rate * len(payload) / 1e6:>8.1f} {rate / baseline:>8.2f}x")
+        workers *= 2
@@ -0,0 +1,51 @@
+# benchmarks/bench_codec.py
+"""
+Micro-benchmark for codec.decode against the old json.loads + dict rebuild.
+
+Measures messages/second on one core for screen/video frames of typical
+sizes, including the single payload copy made when the frame is sent.
+
+Run from the repo root:
+    python -m benchmarks.bench_codec
+    CODEC_JSON=json python -m benchmarks.bench_codec
+"""
+import base64
+import json
+import os
+import time
+
+import codec
+
+
+def baseline(text: str):
+    data = json.loads(text)
+    return {"mime_type": data.get("mime_type", "image/jpeg"), "data": data.get("data")}
+
+
+def fast(text: str):
+    return codec.decode(text).blob
+
+
+def rate(fn, text: str, seconds: float = 1.0) -> float:
+    n = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        for _ in range(50):
+            fn(text)
+        n += 50
+    return n / elapsed
+
+
+if __name__ == "__main__":
+    print(f"JSON backend: {codec.JSON_BACKEND}")
+    print(f"{'frame':>8} {'json msg/s':>12} {'codec msg/s':>12} {'speedup':>8}")
+    for kb in (16, 64, 200, 500):
+        payload = base64.b64encode(os.urandom(kb * 1024 * 3 // 4)).decode()
+        text = json.dumps({"type": "video", "mime_type": "image/jpeg", "data": payload})
+        assert fast(text)["data"] == baseline(text)["data"]
+        slow_rate = rate(baseline, text)
+        fast_rate = rate(fast, text)
+        print(f"{kb:>6}KB {slow_rate:>12.0f} {fast_rate:>12.0f} {fast_rate / slow_rate:>7.1f}x")
+
+    control = json.dumps({"type": "audio", "length": 1024})
+    print(f"{'control':>8} {rate(json.loads, control):>12.0f} {rate(codec.decode, control):>12.0f}")
@@ -0,0 +1,161 @@
+# benchmarks/bench_drain.py
+"""
+Rolling restart under load: dropped turns and reconnect latency.
+
+Starts cluster.py against the loopback Live backend (GEMINI_LOOPBACK=1, no
+network). Text-modality clients run closed-loop turns: send a text turn,
+wait for turn_complete, think, repeat. Halfway through, /cluster/restart
+replaces every worker, and the run continues until all workers are back.
+
+  kill    /cluster/restart?drain=0 - workers are killed and respawned
+  drain   /cluster/restart?drain=1 - workers drain first (drain.py)
+
+A turn is dropped when its connection closes before turn_complete.
+Reconnect latency runs from the close to the first pong on the new
+connection, so it includes retry_after_ms and admission waits.
+
+Run from the repo root:
+    python -m benchmarks.bench_drain --workers 2 --clients 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_cluster import ROOT, _wait_for_port
+
+
+async def http_get(port: int, path: str) -> dict:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    return json.loads(raw.split(b"\r\n\r\n", 1)[1] or b"{}")
+
+
+class Totals:
+    def __init__(self):
+        self.turns = 0
+        self.dropped = 0
+        self.reconnects = []        # seconds from close to first pong
+        self.told = 0               # closes that came with a reconnect message
+
+
+async def client(i: int, port: int, stop: float, totals: Totals):
+    import websockets
+
+    session_id = f"drain-{os.getpid()}-{i}"
+    uri = f"ws://127.0.0.1:{port}/ws?session_id={session_id}&modality=text"
+    closed_at = None
+    while time.perf_counter() < stop:
+        retry_after = None
+        in_turn = False
+        try:
+            async with websockets.connect(uri, max_size=None, open_timeout=10) as ws:
+                await ws.send(json.dumps({"type": "ping"}))
+                next_turn = None        # think time runs while we keep reading
+                while time.perf_counter() < stop:
+                    timeout = None if next_turn is None else max(0.0, next_turn - time.perf_counter())
+                    try:
+                        msg = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+                    except asyncio.TimeoutError:
+                        await ws.send(json.dumps({"type": "text", "text": f"turn from client {i}"}))
+                        in_turn, next_turn = True, None
+                        continue
+                    if msg["type"] == "pong":
+                        if closed_at is not None:
+                            totals.reconnects.append(time.perf_counter() - closed_at)
+                            closed_at = None
+                        next_turn = time.perf_counter() + random.uniform(0.2, 1.0)
+                    elif msg["type"] == "reconnect":
+                        retry_after = msg["retry_after_ms"] / 1000
+                    elif msg["type"] == "turn_complete":
+                        totals.turns += 1
+                        in_turn = False
+                        next_turn = time.perf_counter() + random.uniform(0.2, 1.0)
+                return
+        except (OSError, asyncio.TimeoutError, websockets.ConnectionClosed, websockets.InvalidStatus):
+            pass
+        if in_turn:
+            totals.dropped += 1
+        if closed_at is None:
+            closed_at = time.perf_counter()
+        if retry_after is not None:
+            totals.told += 1
+            await asyncio.sleep(retry_after)
+        else:
+            # Clients without a hint back off with jitter, as before
+            await asyncio.sleep(random.uniform(0.1, 1.0))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+async def run(args, drain: bool):
+    env = dict(os.environ, GEMINI_LOOPBACK="1", LOOPBACK_LATENCY=str(args.model_latency))
+    cluster = subprocess.Popen(
+        [sys.executable, "cluster.py", "--workers", str(args.workers), "--host", "127.0.0.1",
+         "--port", str(args.port), "--backend-port", str(args.backend_port),
+         "--admin-port", str(args.admin_port)],
+        cwd=ROOT, env=env,
+    )
+    try:
+        for i in range(args.workers):
+            _wait_for_port(args.backend_port + i)
+        _wait_for_port(args.port)
+
+        totals = Totals()
+        stop = time.perf_counter() + 3600
+        clients = [asyncio.create_task(client(i, args.port, stop, totals)) for i in range(args.clients)]
+        await asyncio.sleep(args.warmup)
+
+        before = totals.turns
+        restart_at = time.perf_counter()
+        await http_get(args.admin_port, f"/cluster/restart?drain={int(drain)}")
+        await asyncio.sleep(1.0)
+        while (await http_get(args.admin_port, "/cluster/stats")).get("restarting"):
+            await asyncio.sleep(0.5)
+        restart_s = time.perf_counter() - restart_at
+        await asyncio.sleep(args.warmup)
+        stats = await http_get(args.admin_port, "/cluster/stats")
+
+        for task in clients:
+            task.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+
+        label = "drain" if drain else "kill"
+        print(f"{label:<6} restart {restart_s:>5.1f}s   turns {totals.turns - before:>6}"
+              f"   dropped {totals.dropped:>4}   reconnect p50 {percentile(totals.reconnects, 50):>5.2f}s"
+              f"   p99 {percentile(totals.reconnects, 99):>5.2f}s   told {totals.told}")
+        admitted = [w.get("admission", {}) for w in stats.get("workers", [])]
+        print(f"{'':<6} admission per worker: {admitted}")
+    finally:
+        cluster.terminate()
+        cluster.wait()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--model-latency", type=float, default=0.3)
+    parser.add_argument("--port", type=int, default=8810)
+    parser.add_argument("--backend-port", type=int, default=9810)
+    parser.add_argument("--admin-port", type=int, default=8811)
+    args = parser.parse_args()
+
+    print(f"{args.clients} text clients, {args.workers} workers, rolling restart")
+    await run(args, drain=False)
+    await run(args, drain=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+# benchmarks/bench_modality.py
+"""
+Per-session cost of audio vs text response modality.
+
+Opens N SessionManagers of each modality against the loopback Live backend
+(no network, no API key), runs a few turns on each and reports:
+
+  mem/session    Python heap allocated per live session (tracemalloc)
+  tasks/session  asyncio tasks the session keeps running
+  egress/turn    bytes the /ws egress path would send back per model turn
+  turn           time from user turn to the last reply chunk
+
+Audio sessions speak `--speech-ms` of PCM per turn and get PCM back; text
+sessions send one {"type": "text"} turn and get text deltas back.
+
+Run from the repo root:
+    python -m benchmarks.bench_modality --sessions 50 --turns 3
+"""
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault("GEMINI_LOOPBACK", "1")
+os.environ.setdefault("LOOPBACK_LATENCY", "0.05")
+
+import codec
+from session_manager import SessionManager
+
+CHUNK = b"\x00\x10" * 1600      # 100 ms of 16 kHz PCM, loud enough for the VAD
+
+
+async def audio_turn(sm, speech_ms):
+    for _ in range(speech_ms // 100):
+        await sm.enqueue_audio(CHUNK)
+        await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    egress = 0
+    # Loopback ends the turn after 0.5 s of silence, then streams the reply
+    while True:
+        try:
+            data = await asyncio.wait_for(sm.audio.audio_in_queue.get(), timeout=1.5)
+        except asyncio.TimeoutError:
+            break
+        egress += len(data)
+        last = time.perf_counter()
+    return egress, (last - start) if egress else 0.0
+
+
+async def text_turn(sm):
+    start = time.perf_counter()
+    await sm.send_text("What should I revise before tomorrow's physics exam?")
+    egress = 0
+    while (text := await sm.text_out_queue.get()) is not None:
+        egress += len(codec.encode({"type": "text_delta", "text": text}))
+    egress += len(codec.encode({"type": "turn_complete"}))
+    return egress, time.perf_counter() - start
+
+
+async def measure(modality, sessions, turns, speech_ms):
+    base_tasks = len(asyncio.all_tasks())
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    managers = [SessionManager(modality=modality) for _ in range(sessions)]
+    runs = [asyncio.create_task(sm.run()) for sm in managers]
+    await asyncio.gather(*(sm.connected.wait() for sm in managers))
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    mem = sum(s.size_diff for s in after.compare_to(before, "filename")) / sessions
+    tasks = (len(asyncio.all_tasks()) - base_tasks) / sessions
+
+    egress, turn_time = [], []
+    for _ in range(turns):
+        if modality == "audio":
+            results = await asyncio.gather(*(audio_turn(sm, speech_ms) for sm in managers))
+        else:
+            results = await asyncio.gather(*(text_turn(sm) for sm in managers))
+        for nbytes, seconds in results:
+            egress.append(nbytes)
+            turn_time.append(seconds)
+
+    for task in runs:
+        task.cancel()
+    await asyncio.gather(*runs, return_exceptions=True)
+
+    print(f"{modality:<6} mem/session {mem / 1024:>8.1f} KiB   tasks/session {tasks:>4.1f}"
+          f"   egress/turn {sum(egress) / len(egress) / 1024:>8.1f} KiB"
+          f"   turn {sum(turn_time) / len(turn_time) * 1000:>7.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--speech-ms", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions x {args.turns} turns, loopback backend")
+    await measure("audio", args.sessions, args.turns, args.speech_ms)
+    await measure("text", args.sessions, args.turns, args.speech_ms)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
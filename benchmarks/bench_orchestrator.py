@@ -0,0 +1,51 @@
+# benchmarks/bench_orchestrator.py
+"""
+Multi-agent fan-out: serial handoffs vs. the DAG orchestrator.
+
+Uses the fake fixed-latency chat model from bench_agents, so every agent step
+costs the same simulated LLM round trip. The plan fans out to scheduler,
+study_coach and wellness in parallel, then joins in a summary step.
+
+Run from the repo root:
+    python -m benchmarks.bench_orchestrator --latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from api import APIManager
+from cache import ResponseCache
+from orchestrator import Orchestrator, parse_plan
+from benchmarks.bench_agents import FakeLLM
+
+PLAN = json.dumps({"steps": [
+    {"id": "cal", "agent": "scheduler", "context": "find a free hour tomorrow", "depends_on": []},
+    {"id": "study", "agent": "study_coach", "context": "plan a revision block", "depends_on": []},
+    {"id": "body", "agent": "wellness", "context": "suggest a stretch routine", "depends_on": []},
+    {"id": "wrap", "agent": "scheduler", "context": "put it all in the calendar",
+     "depends_on": ["cal", "study", "body"]},
+]})
+
+
+async def main(args):
+    api = APIManager("unused", llm=FakeLLM(latency=args.latency), cache=ResponseCache(ttl=0))
+    steps = parse_plan(PLAN, known_agents=api.agent_manager.agents)
+
+    start = time.perf_counter()
+    for step in steps:   # what step-by-step handoffs cost
+        await api.agent_manager.arun_agent(step.agent, "Alex", step.context)
+    serial_wall = time.perf_counter() - start
+
+    report = await Orchestrator(api, args.max_parallel).run(steps, "Alex")
+    print(f"serial handoffs       {serial_wall:>6.2f}s")
+    print(f"orchestrated (wall)   {report.wall_time:>6.2f}s")
+    print(f"critical path         {report.critical_path_latency:>6.2f}s  {' -> '.join(report.critical_path)}")
+    print(f"serial baseline (sum) {report.serial_latency:>6.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--max-parallel", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+# benchmarks/bench_pipeline.py
+"""
+Per-stage cost of the media pipeline (pipeline.py).
+
+Pushes --frames synthetic frames (a 20 ms PCM chunk, with one screen frame
+of --frame-kb every --image-every chunks) through pipelines built from the
+real pieces and reports throughput and each stage's own us/frame counter:
+
+  bare        source -> NullSink, the fixed cost of a hop
+  chain       source -> --depth passthrough stages -> NullSink
+  copy        chain, but every stage copies the payload (what zero-copy avoids)
+  record      source -> RecordTap -> NullSink, writing a real recording
+  websocket   source -> RecordTap(outbound) -> WebSocketSink on a fake socket
+
+Image frames are codec.MediaFrames decoded from client JSON, so the
+benchmark also shows that passing them through stages never slices the
+base64 payload out of the message.
+
+Run from the repo root:
+    python -m benchmarks.bench_pipeline --frames 50000 --depth 4
+"""
+import argparse
+import asyncio
+import base64
+import os
+import tempfile
+import time
+
+import codec
+import recorder
+from pipeline import Frame, NullSink, Pipeline, RecordTap, Source, Stage, WebSocketSink
+
+PCM_CHUNK = 640             # 20 ms of 16 kHz 16-bit PCM
+
+
+class SyntheticSource(Source):
+    def __init__(self, n, image_every, frame_kb):
+        super().__init__("source")
+        self.n = n
+        self.image_every = image_every
+        payload = base64.b64encode(os.urandom(frame_kb * 1024)).decode()
+        self.message = codec.encode({"type": "screen", "mime_type": "image/jpeg", "data": payload})
+        self.pcm = os.urandom(PCM_CHUNK)
+
+    async def frames(self):
+        for i in range(self.n):
+            if self.image_every and i % self.image_every == 0:
+                yield Frame.image(codec.decode(self.message))
+            else:
+                yield Frame.audio(self.pcm)
+            if i % 256 == 0:
+                await asyncio.sleep(0)      # let the recorder's flush timer run
+
+
+class CopyStage(Stage):
+    async def process(self, frame):
+        if frame.kind == "audio":
+            return (Frame.audio(bytes(frame.payload)),)
+        return (Frame.image(frame.data, frame.mime_type),)
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = 0
+
+    async def send_bytes(self, data):
+        self.sent += len(data)
+
+    async def send_text(self, text):
+        self.sent += len(text)
+
+
+class LazySink(NullSink):
+    """Counts image frames that reach the sink with their payload still unsliced"""
+    def __init__(self):
+        super().__init__("sink")
+        self.images = 0
+        self.lazy = 0
+
+    async def write(self, frame):
+        if frame.kind == "image":
+            self.images += 1
+            self.lazy += frame.payload._data is None
+
+
+async def run(label, args, stages, sink):
+    source = SyntheticSource(args.frames, args.image_every, args.frame_kb)
+    pipeline = Pipeline([source], stages, sink, name=label)
+    start = time.perf_counter()
+    await pipeline.run()
+    elapsed = time.perf_counter() - start
+    per_stage = "  ".join(
+        f"{name} {s['us_per_frame']:.1f}" for name, s in pipeline.stats().items() if name != "source"
+    )
+    print(f"{label:<10} {args.frames / elapsed / 1000:>8.1f} kframes/s   {elapsed / args.frames * 1e6:>6.2f} us/frame"
+          f"   per stage (us): {per_stage}")
+    return pipeline
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=50000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--image-every", type=int, default=50)
+    parser.add_argument("--frame-kb", type=int, default=150)
+    args = parser.parse_args()
+
+    print(f"{args.frames} frames, 1 image of {args.frame_kb} KB per {args.image_every}, {PCM_CHUNK} B PCM otherwise")
+    await run("bare", args, [], NullSink())
+    sink = LazySink()
+    await run("chain", args, [Stage(f"pass{i}") for i in range(args.depth)], sink)
+    print(f"{'':<10} {sink.lazy}/{sink.images} images reached the sink without a payload copy")
+    await run("copy", args, [CopyStage(f"copy{i}") for i in range(args.depth)], NullSink())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rec = recorder.Recorder(os.path.join(tmp, "bench.rec"))
+        await run("record", args, [RecordTap(rec)], NullSink())
+        await rec.aclose()
+        print(f"{'':<10} recorded {rec.records} records in {rec.chunks} chunks,"
+              f" {os.path.getsize(rec.path) / 1e6:.1f} MB")
+
+        rec = recorder.Recorder(os.path.join(tmp, "bench-out.rec"))
+        ws = FakeWebSocket()
+        await run("websocket", args, [RecordTap(rec, outbound=True)], WebSocketSink(ws))
+        await rec.aclose()
+        print(f"{'':<10} sent {ws.sent / 1e6:.1f} MB to the socket")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
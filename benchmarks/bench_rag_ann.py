@@ -0,0 +1,78 @@
+# benchmarks/bench_rag_ann.py
+"""
+Recall@k / QPS / memory of the index types RAG switches between.
+
+Generates clustered random 384-d vectors (closer to real embeddings than
+uniform noise), uses an exhaustive flat search as ground truth and reports,
+for each index spec and search setting, build time, recall@k against the
+flat baseline, single-query QPS and serialized index size.
+
+Run from the repo root:
+    python -m benchmarks.bench_rag_ann --n 100000 1000000 --k 10
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from rag import EMBED_DIM, build_index, choose_index_spec, ivf_nlist, set_search_params
+
+
+def clustered(n: int, rng, centers: int = 1000):
+    means = rng.standard_normal((centers, EMBED_DIM), dtype="float32")
+    labels = rng.integers(0, centers, n)
+    return means[labels] + 0.3 * rng.standard_normal((n, EMBED_DIM), dtype="float32")
+
+
+def qps(index, queries, k):
+    start = time.perf_counter()
+    for q in queries:
+        index.search(q[None, :], k)
+    return len(queries) / (time.perf_counter() - start)
+
+
+def recall(found, truth, k):
+    return np.mean([len(set(f[:k]) & set(t[:k])) / k for f, t in zip(found, truth)])
+
+
+def bench(n: int, args):
+    rng = np.random.default_rng(0)
+    data = clustered(n, rng)
+    queries = clustered(args.queries, rng)
+
+    flat = build_index("Flat", EMBED_DIM, [data])
+    _, truth = flat.search(queries, args.k)
+    print(f"\n{n} vectors (auto choice: {choose_index_spec(n)}, compressed: {choose_index_spec(n, True)})")
+    print(f"{'index':<22} {'param':>12} {'build':>8} {'recall@' + str(args.k):>10} {'QPS':>8} {'size':>9}")
+    print(f"{'Flat':<22} {'-':>12} {'-':>8} {1.0:>10.3f} {qps(flat, queries, args.k):>8.0f} "
+          f"{len(faiss.serialize_index(flat)) / 2**20:>7.0f}MB")
+
+    specs = [
+        ("HNSW32", "efSearch", [16, 64, 128]),
+        (f"IVF{ivf_nlist(n)},Flat", "nprobe", [1, 8, 32]),
+        (f"IVF{ivf_nlist(n)},PQ{EMBED_DIM // 8}", "nprobe", [1, 8, 32]),
+    ]
+    for spec, param, values in specs:
+        start = time.perf_counter()
+        index = build_index(spec, EMBED_DIM, [data])
+        built = time.perf_counter() - start
+        size = len(faiss.serialize_index(index)) / 2**20
+        for value in values:
+            if param == "nprobe":
+                set_search_params(index, nprobe=value)
+            else:
+                set_search_params(index, ef_search=value)
+            _, found = index.search(queries, args.k)
+            print(f"{spec:<22} {param + '=' + str(value):>12} {built:>7.1f}s "
+                  f"{recall(found, truth, args.k):>10.3f} {qps(index, queries, args.k):>8.0f} {size:>7.0f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    for n in args.n:
+        bench(n, args)
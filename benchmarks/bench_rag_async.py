@@ -0,0 +1,93 @@
+# benchmarks/bench_rag_async.py
+"""
+Query throughput and tail latency of RAG.aquery with 100 concurrent callers.
+
+Compares four paths over the same store:
+  blocking   RAG.query called straight from the event loop (old behaviour)
+  batched    RAG.aquery, cold cache - concurrent calls share model batches
+  cached     RAG.aquery again on the same texts - LRU hits, search only
+  mixed      RAG.aquery while other callers RAG.aadd_doc into the same tail;
+             fails if a query crashes or an added document cannot be found
+
+Run from the repo root:
+    python -m benchmarks.bench_rag_async --callers 100 --docs 20000
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+import embeddings
+from rag import RAG
+
+WORDS = ("focus break calendar exam stretch sleep water walk reminder meeting "
+         "revision physics maths essay deadline breathing yoga lunch coffee").split()
+
+
+def sentences(n, rng):
+    return [" ".join(rng.choice(WORDS, 8)) for _ in range(n)]
+
+
+def report(label, latencies, elapsed):
+    lat = np.sort(np.array(latencies)) * 1000
+    print(f"{label:<10} {len(lat) / elapsed:>8.0f} q/s   p50 {np.percentile(lat, 50):>7.1f} ms"
+          f"   p99 {np.percentile(lat, 99):>7.1f} ms")
+
+
+async def run(rag, queries, callers, fn):
+    latencies = []
+    queue = list(queries)
+
+    async def caller():
+        while queue:
+            text = queue.pop()
+            start = time.perf_counter()
+            await fn(text)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(callers)))
+    return latencies, time.perf_counter() - start
+
+
+async def main(args):
+    rng = np.random.default_rng(0)
+    embeddings.warmup()
+    rag = RAG()
+    rag.add_docs(sentences(args.docs, rng))
+    rag.save()
+
+    queries = sentences(args.queries, rng)
+
+    async def blocking(text):
+        rag.query(text, 3)
+
+    embeddings.cache.clear()
+    report("blocking", *await run(rag, queries, args.callers, blocking))
+    embeddings.cache.clear()
+    report("batched", *await run(rag, queries, args.callers, lambda t: rag.aquery(t, 3)))
+    report("cached", *await run(rag, queries, args.callers, lambda t: rag.aquery(t, 3)))
+
+    added = sentences(args.queries // 4, rng)
+    pending = list(added)
+
+    async def writer():
+        while pending:
+            await rag.aadd_doc(pending.pop())
+
+    writes = asyncio.gather(*(writer() for _ in range(max(args.callers // 10, 1))))
+    report("mixed", *await run(rag, queries, args.callers, lambda t: rag.aquery(t, 3)))
+    await writes
+    missing = [t for t in added if all(d["text"] != t for d in await rag.aquery_docs(t, 3))]
+    assert not missing, f"{len(missing)}/{len(added)} documents added during queries are not searchable"
+    print(f"{'':<10} {len(added)} documents added during queries, all searchable")
+    print(embeddings.batcher.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--callers", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--docs", type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+# benchmarks/bench_rag_store.py
+"""
+Cold-start time and RSS of a persistent RAG store at 100k and 1M documents.
+
+Builds each store once from random 384-d vectors (no embedding model
+needed), then opens it in fresh subprocesses, memory-mapped and fully
+loaded, and reports open time, first query latency and RSS.
+
+Run from the repo root:
+    python -m benchmarks.bench_rag_store --sizes 100000 1000000 --dir /tmp/rag-bench
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def build(path: str, n: int, batch: int = 50_000):
+    from rag import RAG, EMBED_DIM
+
+    if os.path.exists(os.path.join(path, "manifest.json")):
+        return
+    rag = RAG(path)
+    rng = np.random.default_rng(0)
+    for start in range(0, n, batch):
+        count = min(batch, n - start)
+        vecs = rng.standard_normal((count, EMBED_DIM), dtype="float32")
+        rag.add_embeddings(vecs, [f"document {start + i}" for i in range(count)],
+                           [{"source": "bench"}] * count)
+    rag.close()
+
+
+def probe(path: str, mmap: bool):
+    """Runs in a fresh interpreter: open the store, query once, report"""
+    from rag import RAG, EMBED_DIM
+
+    before = rss_mb()
+    start = time.perf_counter()
+    rag = RAG(path, mmap=mmap)
+    opened = time.perf_counter() - start
+    q = np.random.default_rng(1).standard_normal((1, EMBED_DIM), dtype="float32")
+    start = time.perf_counter()
+    I, D = rag.search(q, 5)
+    rag.lookup(I[0], D[0])
+    first_query = time.perf_counter() - start
+    print(json.dumps({"open_s": opened, "first_query_s": first_query,
+                      "rss_mb": rss_mb(), "rss_delta_mb": rss_mb() - before}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--dir", default="/tmp/rag-bench")
+    parser.add_argument("--probe", help=argparse.SUPPRESS)
+    parser.add_argument("--no-mmap", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        probe(args.probe, not args.no_mmap)
+        sys.exit(0)
+
+    print(f"{'docs':>9} {'mode':>6} {'open':>8} {'1st query':>10} {'RSS':>9} {'ΔRSS':>9}")
+    for n in args.sizes:
+        path = os.path.join(args.dir, f"store-{n}")
+        t = time.perf_counter()
+        build(path, n)
+        print(f"built {n} docs in {time.perf_counter() - t:.1f}s")
+        for label, extra in (("mmap", []), ("load", ["--no-mmap"])):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_rag_store", "--probe", path, *extra],
+                cwd=ROOT, capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            r = json.loads(out)
+            print(f"{n:>9} {label:>6} {r['open_s'] * 1000:>6.0f}ms {r['first_query_s'] * 1000:>8.0f}ms "
+                  f"{r['rss_mb']:>7.0f}MB {r['rss_delta_mb']:>7.0f}MB")
@@ -0,0 +1,109 @@
+# benchmarks/bench_uplink.py
+"""
+Voice latency under screen-share load, with and without the uplink scheduler.
+
+A simulated uplink sends bytes one message at a time at --link-bps (a FIFO,
+like a NIC queue). Audio sessions each send a 100 ms PCM chunk every 100 ms.
+Screen sessions push frames back to back. The heaviest of them belongs to
+a tenant with weight 2.
+
+  direct     every session sends straight to the link (old behaviour)
+  scheduled  sends go through UplinkScheduler capped at 90% of the link
+
+Reports audio latency (chunk ready -> on the wire) and video throughput per
+tenant.
+
+Run from the repo root:
+    python -m benchmarks.bench_uplink --audio 50 --screens 5 --seconds 10
+"""
+import argparse
+import asyncio
+import contextlib
+import time
+
+from uplink import UplinkScheduler
+
+AUDIO_CHUNK = 3200          # 100 ms of 16 kHz 16-bit PCM
+
+
+class Link:
+    """Serialised uplink: each message occupies it for size / rate seconds, in call order"""
+    def __init__(self, rate):
+        self.rate = rate
+        self.busy_until = 0.0
+
+    async def send(self, nbytes):
+        now = time.perf_counter()
+        self.busy_until = max(now, self.busy_until) + nbytes / self.rate
+        await asyncio.sleep(self.busy_until - now)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+async def run(args, scheduler):
+    link = Link(args.link_bps)
+    latencies = []
+    video_bytes = {}
+    start = time.perf_counter()
+    stop = start + args.seconds
+
+    async def audio_session(i):
+        tenant = f"voice-{i}"
+        next_at = time.perf_counter() + (i % 10) * 0.01
+        while next_at < stop:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            ready = time.perf_counter()
+            guard = scheduler.audio(tenant, AUDIO_CHUNK, ready) if scheduler else contextlib.nullcontext()
+            async with guard:
+                await link.send(AUDIO_CHUNK)
+            latencies.append(time.perf_counter() - ready)
+            next_at += 0.1
+
+    async def screen_session(i):
+        tenant = "enterprise" if i == 0 else f"screen-{i}"
+        frame = args.frame_kb * 1024 * (3 if i == 0 else 1)
+        while time.perf_counter() < stop:
+            if scheduler:
+                async with scheduler.video(tenant, frame) as granted:
+                    if not granted:
+                        continue
+                    await link.send(frame)
+            else:
+                await link.send(frame)
+            video_bytes[tenant] = video_bytes.get(tenant, 0) + frame
+
+    await asyncio.gather(
+        *(audio_session(i) for i in range(args.audio)),
+        *(screen_session(i) for i in range(args.screens)),
+    )
+
+    elapsed = time.perf_counter() - start
+    label = "scheduled" if scheduler else "direct"
+    print(f"{label:<10} audio p50 {percentile(latencies, 50) * 1000:>7.1f} ms"
+          f"   p99 {percentile(latencies, 99) * 1000:>7.1f} ms   max {max(latencies) * 1000:>7.1f} ms")
+    share = "  ".join(f"{t} {b / elapsed / 1e6:.2f}" for t, b in sorted(video_bytes.items()))
+    print(f"{'':<10} video MB/s: {share}")
+    if scheduler:
+        stats = scheduler.stats()
+        print(f"{'':<10} video wait avg {stats['wait']['video']['avg_ms']} ms, dropped {stats['video_dropped']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--audio", type=int, default=50)
+    parser.add_argument("--screens", type=int, default=5)
+    parser.add_argument("--frame-kb", type=int, default=150)
+    parser.add_argument("--link-bps", type=float, default=4e6)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{args.audio} voice + {args.screens} screen sessions on a {args.link_bps / 1e6:.1f} MB/s uplink")
+    await run(args, None)
+    await run(args, UplinkScheduler(rate=args.link_bps * 0.9, weights={"enterprise": 2.0}))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
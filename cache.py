@@ -0,0 +1,179 @@
+# cache.py
+"""
+Response cache for agent / MCP calls.
+
+Entries are keyed by (kind, agent, role, task, user, normalized context), expire
+after a TTL and are evicted LRU-first once either the entry count or the
+approximate memory budget is exceeded. Identical requests that arrive while
+the first one is still in flight wait for it instead of calling the LLM again
+(single-flight), both for async callers and for blocking callers on threads.
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 300.0                 # seconds
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def normalize_context(context) -> str:
+    """Collapse whitespace/case in text and sort keys in structured context"""
+    if isinstance(context, str):
+        return " ".join(context.split()).lower()
+    try:
+        return json.dumps(context, sort_keys=True, default=str)
+    except TypeError:
+        return repr(context)
+
+
+def _sizeof(value) -> int:
+    content = getattr(value, "content", value)
+    if isinstance(content, (str, bytes)):
+        return sys.getsizeof(content) + 256  # +message object overhead
+    return sys.getsizeof(value)
+
+
+class ResponseCache:
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()      # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight_async = {}          # key -> asyncio.Task running fn()
+        self._inflight_sync = {}           # key -> threading.Event + result slot
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(kind, agent, role, task, context, user_name=None):
+        # user_name is part of the key because the prompt addresses the user by name
+        return (kind, agent, role, task, user_name, normalize_context(context))
+
+    # ---------------------------------------------------------------- storage
+
+    def get(self, key):
+        """Return (True, value) on a fresh hit, (False, None) otherwise"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def put(self, key, value):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def discard(self, key):
+        """Drop one entry, e.g. a response that turned out to be unusable"""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # ---------------------------------------------------------- single flight
+
+    async def aget_or_call(self, key, fn):
+        """Async lookup; on miss runs fn() once, in its own task, for all concurrent callers of key"""
+        hit, value = self.get(key)
+        if hit:
+            return value
+
+        task = self._inflight_async.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # Cancelling one caller (the first included) must not cancel the call the others wait on
+            task = asyncio.ensure_future(fn())
+            self._inflight_async[key] = task
+            task.add_done_callback(lambda t: self._settle(key, t))
+        return await asyncio.shield(task)
+
+    def _settle(self, key, task):
+        if self._inflight_async.get(key) is task:
+            del self._inflight_async[key]
+        if task.cancelled():
+            return
+        if task.exception() is None:  # also marks a failure retrieved when every caller has gone
+            self.put(key, task.result())
+
+    def get_or_call(self, key, fn):
+        """Blocking lookup; concurrent threads asking for key share one fn() call"""
+        hit, value = self.get(key)
+        if hit:
+            return value
+
+        with self._lock:
+            slot = self._inflight_sync.get(key)
+            leader = slot is None
+            if leader:
+                slot = {"event": threading.Event(), "value": None, "error": None}
+                self._inflight_sync[key] = slot
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            slot["event"].wait()
+            if slot["error"] is not None:
+                raise slot["error"]
+            return slot["value"]
+
+        try:
+            value = fn()
+            self.put(key, value)
+            slot["value"] = value
+            return value
+        except Exception as e:
+            slot["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight_sync[key]
+            slot["event"].set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
+
+
+# Process-wide cache shared by every APIManager
+shared_cache = ResponseCache()
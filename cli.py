@@ -0,0 +1,78 @@
+# cli.py
+"""
+Talk to the Live model from this machine: microphone, camera or screen in,
+speaker or console out.
+
+Runs the same SessionManager and pipeline pieces as the /ws server, with
+local devices as sources and sinks instead of the WebSocket:
+
+    MicSource, CameraSource | ScreenSource, StdinSource -> SessionSink
+    SessionOutputSource -> SpeakerSink (audio replies) | ConsoleSink (text replies)
+
+Type a message and press enter to send a text turn; "q" quits. Use
+headphones with --modality audio, there is no echo cancellation.
+
+    python cli.py --video camera
+    python cli.py --modality text --no-mic --video screen
+    python cli.py --record recordings      # replayable with replay.py
+"""
+import argparse
+import asyncio
+import json
+
+import recorder
+from pipeline import (CameraSource, ConsoleSink, MicSource, Pipeline, RecordTap, ScreenSource,
+                      SessionOutputSource, SessionSink, SpeakerSink, StdinSource)
+from session_manager import SessionManager
+
+
+async def run(args):
+    sm = SessionManager(mode=args.video, modality=args.modality)
+    run_task = asyncio.create_task(sm.run())
+    rec = recorder.Recorder.for_session(args.record, "cli", {"modality": args.modality}) if args.record else None
+    taps_in = [RecordTap(rec)] if rec else []
+    taps_out = [RecordTap(rec, outbound=True)] if rec else []
+
+    sources = []
+    if not args.no_mic:
+        sources.append(MicSource("mic"))
+    if args.video == "camera":
+        sources.append(CameraSource(args.interval, "camera"))
+    elif args.video == "screen":
+        sources.append(ScreenSource(args.interval, "screen"))
+    media = Pipeline(sources, taps_in, SessionSink(sm), name="media").start()
+    replies = Pipeline(
+        [SessionOutputSource(sm)], taps_out, SpeakerSink() if args.modality == "audio" else ConsoleSink("console"),
+        name="replies",
+    ).start()
+
+    # The session lasts as long as the terminal does
+    typed = Pipeline([StdinSource("stdin")], taps_in, SessionSink(sm), name="typed")
+    try:
+        await typed.run()
+    finally:
+        for pipeline in (media, replies):
+            await pipeline.stop()
+        run_task.cancel()
+        await asyncio.gather(run_task, return_exceptions=True)
+        if rec:
+            await rec.aclose()
+            print(f"💾 Recorded to {rec.path}")
+    if args.stats:
+        print(json.dumps({p.name: p.stats() for p in (media, typed, replies)} | {"session": sm.stats()}, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", choices=["camera", "screen", "none"], default="none")
+    parser.add_argument("--modality", choices=["audio", "text"], default="audio", help="reply modality")
+    parser.add_argument("--no-mic", action="store_true", help="typed turns only")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between camera/screen frames")
+    parser.add_argument("--record", metavar="DIR", help="record the session to DIR (see recorder.py)")
+    parser.add_argument("--stats", action="store_true", help="print pipeline and session counters on exit")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
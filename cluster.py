@@ -0,0 +1,402 @@
+# cluster.py
+"""
+Multi-process serving for the /ws backend.
+
+`main.py` keeps every session in the process-local `active_sessions` dict, so a
+single uvicorn worker is capped at one core. This module runs N workers and
+spreads connections across them in one of two ways:
+
+  proxy      A small asyncio front accepts connections, reads the HTTP upgrade
+             head and routes it to a worker. Clients that pass
+             `/ws?session_id=...` always land on the same worker (stable
+             hash), everybody else goes to the least-loaded worker. After the
+             head the front only splices bytes, it never parses frames.
+  reuseport  Every worker binds the public port with SO_REUSEPORT and the
+             kernel balances connections. Cheapest, but no session affinity.
+
+Each worker also gets a multiprocessing Pipe as a control channel, which the
+front uses to aggregate `/cluster/stats` and to drain workers.
+
+`/cluster/restart` restarts the workers one at a time. Each worker is
+drained first (see drain.py): it stops getting new connections, and its
+clients are told to reconnect between turns. It is then replaced. Pass
+`?drain=0` for the old kill-and-respawn behaviour.
+
+`/cluster/stats` and `/cluster/restart` are served only on `--admin-port`,
+never on the public port. Keep the admin port off the public network, it
+has no auth.
+
+Usage:
+    python cluster.py --workers 4 --port 8000 --admin-port 8001
+    python cluster.py --workers 4 --port 8000 --mode reuseport --admin-port 8001
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import zlib
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+from usage import add_usage
+
+HEAD_LIMIT = 64 * 1024
+PIPE_CHUNK = 256 * 1024
+CONTROL_TIMEOUT = 2.0
+DRAIN_DEADLINE = 20.0       # per worker during a rolling restart
+READY_TIMEOUT = 30.0
+STOP_MARGIN = 5.0           # seconds past the drain deadline before SIGKILL
+
+
+# ---------------------------------------------------------------- worker side
+
+def _control_loop(conn):
+    """Answer control-channel commands from the front (runs in a daemon thread)"""
+    import main
+
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return
+        cmd = msg.get("cmd")
+        try:
+            if cmd == "stats":
+                reply = {"ok": True, "stats": main.session_stats()}
+            elif cmd == "drain":
+                main.request_drain(msg.get("deadline", main.DRAIN_DEADLINE))
+                reply = {"ok": True, "draining": True}
+            elif cmd == "ping":
+                reply = {"ok": True, "pid": os.getpid()}
+            else:
+                reply = {"ok": False, "error": f"unknown command {cmd!r}"}
+        except Exception as e:
+            reply = {"ok": False, "error": str(e)}
+        conn.send(reply)
+
+
+def _bind(host: str, port: int, reuse_port: bool) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _worker_main(index: int, host: str, port: int, reuse_port: bool, conn, env=None):
+    import uvicorn
+
+    # Before main (and uplink) are imported, so module-level settings see them
+    os.environ.update(env or {})
+
+    threading.Thread(target=_control_loop, args=(conn,), daemon=True).start()
+    sock = _bind(host, port, reuse_port)
+    config = uvicorn.Config("main:app", log_level="warning", ws_max_size=16 * 1024 * 1024)
+    server = uvicorn.Server(config)
+    print(f"👷 Worker {index} (pid {os.getpid()}) serving on {host}:{port}")
+    server.run(sockets=[sock])
+
+
+# ----------------------------------------------------------------- front side
+
+class WorkerHandle:
+    """Front-side view of one worker process"""
+
+    def __init__(self, index: int, host: str, port: int, reuse_port: bool, env: Optional[dict] = None):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.env = env or {}        # environment overrides for the worker process only
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn = None
+        self.connections = 0
+        # Rolling restart in progress: no new connections, supervisor hands off
+        self.draining = False
+        self._lock = threading.Lock()
+
+    def start(self, ctx):
+        parent, child = ctx.Pipe()
+        self.conn = parent
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(self.index, self.host, self.port, self.reuse_port, child, self.env),
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def request(self, msg: dict) -> dict:
+        """Blocking request/reply over the control pipe; call via asyncio.to_thread"""
+        with self._lock:
+            try:
+                self.conn.send(msg)
+                if not self.conn.poll(CONTROL_TIMEOUT):
+                    return {"ok": False, "error": "timeout"}
+                return self.conn.recv()
+            except (EOFError, OSError) as e:
+                return {"ok": False, "error": str(e)}
+
+    def stop(self, kill: bool = False, timeout: float = DRAIN_DEADLINE + STOP_MARGIN):
+        """
+        Blocking: SIGTERM (the worker drains, see main.drain_and_exit) and
+        SIGKILL once `timeout` has passed, or SIGKILL right away with kill=True.
+        Returns only when the process is gone, so its port can be reused.
+        """
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            if kill:
+                self.process.kill()
+            else:
+                self.process.terminate()
+                self.process.join(timeout)
+                if self.process.is_alive():
+                    print(f"⚠️ Worker {self.index} still running after {timeout:.0f}s, killing it")
+                    self.process.kill()
+        self.process.join()
+
+
+class ClusterFront:
+    def __init__(self, workers: List[WorkerHandle], host: str, port: int, proxy: bool,
+                 admin_port: Optional[int] = None):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.proxy = proxy
+        self.admin_port = admin_port
+        self.ctx = multiprocessing.get_context("spawn")
+        self.routed = 0
+        self.restarting = False
+        self.restarts = []          # reports of finished rolling restarts
+
+    def pick(self, session_id: Optional[str]) -> WorkerHandle:
+        """Stable affinity for resumable sessions, least-connections otherwise; skips draining workers"""
+        serving = [w for w in self.workers if not w.draining] or self.workers
+        if session_id:
+            home = zlib.crc32(session_id.encode()) % len(self.workers)
+            for step in range(len(self.workers)):
+                w = self.workers[(home + step) % len(self.workers)]
+                if not w.draining:
+                    return w
+        return min(serving, key=lambda w: w.connections)
+
+    async def aggregate_stats(self) -> dict:
+        replies = await asyncio.gather(
+            *(asyncio.to_thread(w.request, {"cmd": "stats"}) for w in self.workers)
+        )
+        total = {"workers": [], "sessions": 0, "modes": {}, "usage": {}, "routed": self.routed,
+                 "restarting": self.restarting, "restarts": self.restarts[-5:]}
+        for w, reply in zip(self.workers, replies):
+            entry = {"index": w.index, "port": w.port, "alive": w.alive(), "connections": w.connections,
+                     "draining": w.draining}
+            if reply.get("ok"):
+                stats = reply["stats"]
+                entry.update(stats)
+                total["sessions"] += stats.get("sessions", 0)
+                for mode, count in stats.get("modes", {}).items():
+                    total["modes"][mode] = total["modes"].get(mode, 0) + count
+                add_usage(total["usage"], stats.get("usage", {}))
+            else:
+                entry["error"] = reply.get("error")
+            total["workers"].append(entry)
+        return total
+
+    async def _respond_json(self, writer, payload: dict, status: str = "200 OK"):
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        writer.close()
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(PIPE_CHUNK):
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def handle_admin(self, reader, writer):
+        await self.handle_client(reader, writer, admin=True)
+
+    async def handle_client(self, reader, writer, admin=False):
+        """admin is True only on the admin_port listener; /cluster/* is not served anywhere else"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+
+        request_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+        parts = request_line.split(" ")
+        target = parts[1] if len(parts) > 1 else "/"
+        path, _, query = target.partition("?")
+
+        if path.startswith("/cluster/") and not admin:
+            await self._respond_json(writer, {"error": "not found"}, "404 Not Found")
+            return
+        if path == "/cluster/stats":
+            await self._respond_json(writer, await self.aggregate_stats())
+            return
+        if path == "/cluster/restart":
+            if self.restarting:
+                await self._respond_json(writer, {"error": "restart in progress"}, "409 Conflict")
+                return
+            drain = parse_qs(query).get("drain", ["1"])[0] != "0"
+            asyncio.create_task(self.rolling_restart(drain))
+            await self._respond_json(writer, {"ok": True, "drain": drain, "workers": len(self.workers)})
+            return
+        if not self.proxy:
+            await self._respond_json(writer, {"error": "not found"}, "404 Not Found")
+            return
+
+        session_id = parse_qs(query).get("session_id", [None])[0]
+        worker = self.pick(session_id)
+        try:
+            up_reader, up_writer = await asyncio.open_connection("127.0.0.1", worker.port)
+        except OSError:
+            await self._respond_json(writer, {"error": "worker unavailable"}, "503 Service Unavailable")
+            return
+
+        worker.connections += 1
+        self.routed += 1
+        try:
+            up_writer.write(head)
+            await asyncio.gather(self._pipe(reader, up_writer), self._pipe(up_reader, writer))
+        finally:
+            worker.connections -= 1
+
+    async def _wait_ready(self, w: WorkerHandle):
+        deadline = asyncio.get_running_loop().time() + READY_TIMEOUT
+        while asyncio.get_running_loop().time() < deadline:
+            try:
+                _, probe = await asyncio.open_connection("127.0.0.1", w.port)
+                probe.close()
+                return True
+            except OSError:
+                await asyncio.sleep(0.1)
+        return False
+
+    async def _sessions(self, w: WorkerHandle) -> int:
+        reply = await asyncio.to_thread(w.request, {"cmd": "stats"})
+        return reply["stats"]["sessions"] if reply.get("ok") else 0
+
+    async def rolling_restart(self, drain: bool = True, deadline: float = DRAIN_DEADLINE) -> dict:
+        """Replace workers one at a time, draining each before it is stopped"""
+        self.restarting = True
+        start = asyncio.get_running_loop().time()
+        report = {"drain": drain, "workers": []}
+        try:
+            for w in self.workers:
+                w_start = asyncio.get_running_loop().time()
+                entry = {"index": w.index, "sessions": await self._sessions(w)}
+                w.draining = True
+                if drain:
+                    await asyncio.to_thread(w.request, {"cmd": "drain", "deadline": deadline})
+                    # The worker closes sessions itself; give it the deadline plus a margin
+                    limit = w_start + deadline + 2.0
+                    while asyncio.get_running_loop().time() < limit and await self._sessions(w):
+                        await asyncio.sleep(0.2)
+                    entry["left_over"] = await self._sessions(w)
+                # drain=0 is the hard kill it stands for; otherwise the worker gets to finish
+                await asyncio.to_thread(w.stop, not drain, deadline + STOP_MARGIN)
+                w.connections = 0
+                w.start(self.ctx)
+                entry["ready"] = await self._wait_ready(w)
+                w.draining = False
+                entry["seconds"] = round(asyncio.get_running_loop().time() - w_start, 2)
+                report["workers"].append(entry)
+                print(f"🔁 Worker {w.index} restarted: {entry}")
+        finally:
+            for w in self.workers:
+                w.draining = False
+            self.restarting = False
+        report["seconds"] = round(asyncio.get_running_loop().time() - start, 2)
+        self.restarts.append(report)
+        return report
+
+    async def _supervise(self):
+        """Restart crashed workers in place so affinity (index -> worker) is preserved"""
+        while True:
+            await asyncio.sleep(1.0)
+            for w in self.workers:
+                if not w.alive() and not w.draining:
+                    print(f"⚠️ Worker {w.index} died, restarting")
+                    w.connections = 0
+                    w.start(self.ctx)
+
+    async def serve(self):
+        for w in self.workers:
+            w.start(self.ctx)
+
+        servers = []
+        if self.proxy:
+            servers.append(await asyncio.start_server(
+                self.handle_client, self.host, self.port, limit=HEAD_LIMIT, reuse_address=True,
+            ))
+            print(f"🔀 Cluster front on {self.host}:{self.port} -> {len(self.workers)} workers")
+        if self.admin_port:
+            servers.append(await asyncio.start_server(
+                self.handle_admin, self.host, self.admin_port, limit=HEAD_LIMIT, reuse_address=True,
+            ))
+            print(f"🛠️ Cluster admin on {self.host}:{self.admin_port}")
+
+        supervisor = asyncio.create_task(self._supervise())
+        try:
+            await asyncio.Event().wait()
+        finally:
+            supervisor.cancel()
+            for s in servers:
+                s.close()
+            for w in self.workers:
+                w.stop()
+
+
+def build_cluster(workers: int, host: str = "0.0.0.0", port: int = 8000, mode: str = "proxy",
+                  backend_port: int = 9100, admin_port: Optional[int] = None) -> ClusterFront:
+    proxy = mode == "proxy"
+    # UPLINK_BPS is the node's upstream cap; each worker schedules its share (see uplink.py)
+    env = {}
+    if os.environ.get("UPLINK_BPS"):
+        env["UPLINK_BPS"] = str(float(os.environ["UPLINK_BPS"]) / workers)
+    if proxy:
+        handles = [WorkerHandle(i, "127.0.0.1", backend_port + i, False, env) for i in range(workers)]
+    else:
+        handles = [WorkerHandle(i, host, port, True, env) for i in range(workers)]
+    return ClusterFront(handles, host, port, proxy, admin_port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--mode", choices=["proxy", "reuseport"], default="proxy")
+    parser.add_argument("--backend-port", type=int, default=9100,
+                        help="first loopback port for workers in proxy mode")
+    parser.add_argument("--admin-port", type=int, default=None,
+                        help="port for /cluster/stats and /cluster/restart (not served without it)")
+    args = parser.parse_args()
+
+    front = build_cluster(args.workers, args.host, args.port, args.mode, args.backend_port, args.admin_port)
+    try:
+        asyncio.run(front.serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,190 @@
+# codec.py
+"""
+Control-plane message codec for the /ws endpoint.
+
+Frames from the frontend are JSON text. Most of them are small control
+messages, but screen/video frames carry a multi-hundred-KB base64 `data`
+field. Running a full `json.loads` on those copies the payload into a fresh
+Python string and then `handle_*_frame` copied it again into a new dict.
+
+`decode()` instead locates the `"data"` string in the raw text, parses only
+the small remainder as JSON, and returns a `MediaFrame` that slices the
+payload out of the original text the first time `.data` is read. Frames that
+are dropped before being sent never copy the payload at all.
+
+The JSON backend is picked at import time: orjson, then msgspec, then the
+stdlib. Set CODEC_JSON=json (or orjson / msgspec) to force one.
+"""
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Union
+
+# Messages shorter than this are parsed in one go; the lazy path only pays off
+# for frames with a large payload.
+LAZY_THRESHOLD = 4096
+
+
+def _select_backend():
+    wanted = os.environ.get("CODEC_JSON", "").lower()
+
+    if wanted in ("", "orjson"):
+        try:
+            import orjson
+
+            return "orjson", orjson.loads, lambda obj: orjson.dumps(obj).decode()
+        except ImportError:
+            pass
+
+    if wanted in ("", "msgspec"):
+        try:
+            import msgspec
+
+            decoder = msgspec.json.Decoder()
+            encoder = msgspec.json.Encoder()
+            return "msgspec", decoder.decode, lambda obj: encoder.encode(obj).decode()
+        except ImportError:
+            pass
+
+    return "json", json.loads, lambda obj: json.dumps(obj, separators=(",", ":"))
+
+
+JSON_BACKEND, loads, dumps = _select_backend()
+
+
+# ------------------------------------------------------------------- messages
+
+@dataclass(slots=True)
+class ControlMessage:
+    """Any small JSON message; `fields` holds everything except `type`"""
+    type: Optional[str]
+    fields: Dict[str, Any] = field(default_factory=dict)
+
+    def get(self, key, default=None):
+        return self.fields.get(key, default)
+
+
+@dataclass(slots=True)
+class AudioHeader:
+    """Announces that the next binary frame is PCM audio"""
+    type: str
+    length: int = 0
+
+
+@dataclass(slots=True)
+class MediaFrame:
+    """Screen or camera frame whose base64 payload is sliced out lazily"""
+    type: str
+    mime_type: str
+    _source: Optional[str] = field(default=None, repr=False)
+    _start: int = 0
+    _end: int = 0
+    _data: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def data(self) -> Optional[str]:
+        if self._data is None and self._source is not None:
+            self._data = self._source[self._start:self._end]
+            self._source = None  # release the original frame text
+        return self._data
+
+    @property
+    def size(self) -> int:
+        """Payload length without materialising it"""
+        return len(self._data) if self._data is not None else self._end - self._start
+
+    def span(self):
+        """(text, start, end) holding the base64 payload, without slicing it out"""
+        if self._data is not None or self._source is None:
+            data = self._data or ""
+            return data, 0, len(data)
+        return self._source, self._start, self._end
+
+    @property
+    def blob(self) -> dict:
+        """The dict shape `session.send(input=...)` expects"""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+Message = Union[ControlMessage, AudioHeader, MediaFrame]
+
+MEDIA_TYPES = ("screen", "video")
+
+
+# ------------------------------------------------------------------- decoding
+
+def _locate_data(text: str):
+    """
+    Find the `"data": "<payload>"` member in a flat JSON object.
+
+    Returns (member_start, member_end, value_start, value_end) or None if the
+    text does not look like something the fast path can handle safely.
+    """
+    key = text.find('"data"')
+    if key < 0:
+        return None
+    i = key + 6
+    n = len(text)
+    while i < n and text[i] in " \t\r\n":
+        i += 1
+    if i >= n or text[i] != ":":
+        return None  # "data" appeared as a value, not a key
+    i += 1
+    while i < n and text[i] in " \t\r\n":
+        i += 1
+    if i >= n or text[i] != '"':
+        return None
+    start = i + 1
+    end = text.find('"', start)
+    if end < 0 or text.find("\\", start, end) >= 0:
+        return None  # escaped content, let the real parser deal with it
+
+    # Remove the member together with one adjacent comma so the rest stays valid
+    member_start, member_end = key, end + 1
+    j = member_start - 1
+    while j >= 0 and text[j] in " \t\r\n":
+        j -= 1
+    if j >= 0 and text[j] == ",":
+        member_start = j
+    else:
+        k = member_end
+        while k < n and text[k] in " \t\r\n":
+            k += 1
+        if k < n and text[k] == ",":
+            member_end = k + 1
+    return member_start, member_end, start, end
+
+
+def _from_dict(data: Dict[str, Any]) -> Message:
+    msg_type = data.pop("type", None)
+    if msg_type in MEDIA_TYPES:
+        return MediaFrame(msg_type, data.get("mime_type", "image/jpeg"), _data=data.get("data"))
+    if msg_type == "audio":
+        return AudioHeader(msg_type, data.get("length", 0))
+    return ControlMessage(msg_type, data)
+
+
+def decode(text: str) -> Message:
+    """Decode one text frame from the client into a typed message"""
+    if len(text) >= LAZY_THRESHOLD:
+        span = _locate_data(text)
+        if span is not None:
+            member_start, member_end, start, end = span
+            head = loads(text[:member_start] + text[member_end:])
+            msg_type = head.get("type")
+            if msg_type in MEDIA_TYPES:
+                return MediaFrame(
+                    msg_type,
+                    head.get("mime_type", "image/jpeg"),
+                    _source=text,
+                    _start=start,
+                    _end=end,
+                )
+            # Large non-media message: fall through to a regular parse
+
+    return _from_dict(loads(text))
+
+
+def encode(obj: Dict[str, Any]) -> str:
+    """Encode an outgoing control message"""
+    return dumps(obj)
@@ -0,0 +1,82 @@
+# drain.py
+"""
+Graceful draining and reconnect admission for /ws.
+
+On deploy, a worker is told to drain (SIGTERM, or the cluster control
+command "drain"). From then on it turns away new sessions, and each live
+session is closed as soon as it is between turns, or at the drain deadline
+at the latest. Before closing, the worker sends
+
+    {"type": "reconnect", "retry_after_ms": <jittered>, "session_id": ...}
+
+Clients wait retry_after_ms and reconnect with ?session_id=..., so the
+reconnects from one worker are spread over RECONNECT_SPREAD instead of
+arriving all at once.
+
+The process that takes the reconnects admits sessions through Admission,
+a GCRA rate limiter (ADMIT_RATE sessions/s, bursts of ADMIT_BURST). A
+connection that would wait longer than ADMIT_MAX_WAIT for its slot is sent
+the same reconnect message with a longer delay, so each new Gemini connect
+gets a slot instead of all of them starting at once.
+"""
+import os
+import random
+import time
+
+DRAIN_DEADLINE = float(os.environ.get("DRAIN_DEADLINE", 20))         # seconds for in-flight turns
+RECONNECT_MIN_MS = 250
+RECONNECT_SPREAD = float(os.environ.get("RECONNECT_SPREAD", 5))      # seconds reconnects are spread over
+ADMIT_RATE = float(os.environ.get("ADMIT_RATE", 20))                 # new sessions per second
+ADMIT_BURST = int(os.environ.get("ADMIT_BURST", 20))
+ADMIT_MAX_WAIT = float(os.environ.get("ADMIT_MAX_WAIT", 2))          # seconds a connection may wait
+
+# WebSocket close code 1012: service restart
+CLOSE_RESTART = 1012
+
+
+def reconnect_message(session_id=None, delay: float = 0.0) -> dict:
+    """Control message telling a client to come back after a jittered pause"""
+    retry_after_ms = int(delay * 1000) + random.randint(RECONNECT_MIN_MS, int(RECONNECT_SPREAD * 1000))
+    msg = {"type": "reconnect", "retry_after_ms": retry_after_ms}
+    if session_id:
+        msg["session_id"] = session_id
+    return msg
+
+
+class Admission:
+    """Generic cell rate algorithm: `rate` admissions/s with bursts of `burst`"""
+    def __init__(self, rate=ADMIT_RATE, burst=ADMIT_BURST, max_wait=ADMIT_MAX_WAIT):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.tolerance = self.interval * max(burst - 1, 0)
+        self.max_wait = max_wait
+        self.tat = 0.0              # theoretical arrival time of the next admission
+        self.admitted = 0
+        self.deferred = 0
+        self.waited = 0.0
+
+    def reserve(self):
+        """Seconds to wait before admitting, or None to turn the connection away"""
+        if not self.interval:
+            self.admitted += 1
+            return 0.0
+        now = time.monotonic()
+        tat = max(self.tat, now)
+        wait = max(0.0, tat - self.tolerance - now)
+        if wait > self.max_wait:
+            self.deferred += 1
+            return None
+        self.tat = tat + self.interval
+        self.admitted += 1
+        self.waited += wait
+        return wait
+
+    def backlog(self) -> float:
+        """Seconds until a new connection would be admitted without waiting"""
+        return max(0.0, self.tat - self.tolerance - time.monotonic())
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "deferred": self.deferred,
+            "avg_wait_ms": round(self.waited / self.admitted * 1000, 1) if self.admitted else 0.0,
+        }
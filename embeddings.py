@@ -0,0 +1,198 @@
+# embeddings.py
+"""
+Process-wide sentence embedding model for RAG.
+
+Loading all-MiniLM-L6-v2 takes seconds and a few hundred MB, so the model is
+loaded once per process (lazily, or eagerly via warmup()) and shared by every
+RAG instance. Query embeddings are cached in an LRU keyed by normalized text.
+
+Async callers go through EmbeddingBatcher: concurrent `aencode()` calls from
+many sessions are collected for a couple of milliseconds and encoded as one
+batch on a dedicated worker thread, so the event loop never runs the model.
+Blocking callers (encode(), warmup()) hand their batch to the same thread and
+wait for it, so the model is only ever run by that one thread.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+EMBED_MODEL = "all-MiniLM-L6-v2"
+EMBED_DIM = 384
+CACHE_SIZE = 10_000         # cached query embeddings
+BATCH_WINDOW = 0.002        # seconds to wait for more requests before encoding
+MAX_BATCH = 64
+
+_model = None
+_model_lock = threading.Lock()
+
+# One thread owns the model; torch releases the GIL while it encodes
+_owner = threading.local()
+executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="embed", initializer=lambda: setattr(_owner, "is_owner", True),
+)
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+
+                _model = SentenceTransformer(EMBED_MODEL)
+    return _model
+
+
+def set_model(model):
+    """Install a different encoder (anything with .encode(list[str]) -> array)"""
+    global _model
+    with _model_lock:
+        _model = model
+    cache.clear()
+
+
+def warmup():
+    """Load the model and run one encode so the first real query is fast"""
+    start = time.perf_counter()
+    _owned_encode(["warmup"])
+    print(f"[EMBED] Model ready in {time.perf_counter() - start:.1f}s")
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+class EmbeddingCache:
+    """Thread-safe LRU of normalized text -> float32 vector"""
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, key, vec):
+        with self._lock:
+            self._entries[key] = vec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+cache = EmbeddingCache()
+
+
+def _raw_encode(texts, batch_size=256):
+    vecs = get_model().encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+    return np.asarray(vecs, dtype="float32")
+
+
+def _owned_encode(texts, batch_size=256):
+    """Blocking encode on the model thread (inline when already on it)"""
+    if getattr(_owner, "is_owner", False):
+        return _raw_encode(texts, batch_size)
+    return executor.submit(_raw_encode, texts, batch_size).result()
+
+
+def encode(texts, use_cache=True, batch_size=256):
+    """Blocking encode of many texts -> (n, dim) float32; cached per text when use_cache"""
+    texts = list(texts)
+    if not use_cache:
+        return _owned_encode(texts, batch_size)
+
+    keys = [normalize(t) for t in texts]
+    out = [cache.get(k) for k in keys]
+    missing = [i for i, v in enumerate(out) if v is None]
+    if missing:
+        vecs = _owned_encode([texts[i] for i in missing], batch_size)
+        for i, vec in zip(missing, vecs):
+            cache.put(keys[i], vec)
+            out[i] = vec
+    return np.stack(out) if out else np.zeros((0, EMBED_DIM), dtype="float32")
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent async encode requests into batched model calls"""
+
+    def __init__(self, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []          # (text, use_cache, future)
+        self._flush_handle = None
+        self.batches = 0
+        self.batched_items = 0
+
+    async def aencode(self, text: str, use_cache=True):
+        """Embedding for one text, shape (dim,)"""
+        if use_cache:
+            vec = cache.get(normalize(text))
+            if vec is not None:
+                return vec
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, use_cache, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch):
+        texts = [text for text, _, _ in batch]
+        try:
+            vecs = await asyncio.get_running_loop().run_in_executor(executor, _raw_encode, texts)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.batched_items += len(batch)
+        for (text, use_cache, future), vec in zip(batch, vecs):
+            if use_cache:
+                cache.put(normalize(text), vec)
+            if not future.done():
+                future.set_result(vec)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "avg_batch": self.batched_items / self.batches if self.batches else 0.0,
+            "cache": cache.stats(),
+        }
+
+
+# One batcher per process; futures are bound to whichever loop awaits them
+batcher = EmbeddingBatcher()
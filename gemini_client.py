@@ -2,39 +2,96 @@
 from google import genai
 from google.genai import types
 import os
+import loopback
 
 # new
 MODEL = "models/gemini-2.5-flash-live-preview"
+API_KEY = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+# Local fake Live backend for load tests (see loopback.py)
+LOOPBACK = bool(os.environ.get("GEMINI_LOOPBACK"))
 
-client = genai.Client(
-    http_options={"api_version": "v1beta"},
-    api_key=API_KEY,
-)
-
-CONFIG = types.LiveConnectConfig(
-    response_modalities=[
-        "AUDIO",
-    ],
-    media_resolution="MEDIA_RESOLUTION_LOW",
-    speech_config=types.SpeechConfig(
-        language_code="en-US",
-        voice_config=types.VoiceConfig(
-            prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name="Aoede")
+# Created on first real connect, so loopback runs need neither a key nor the network
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = genai.Client(
+            http_options={"api_version": "v1beta"},
+            api_key=API_KEY,
+        )
+    return _client
+
+# Context window compression as (trigger_tokens, target_tokens). Frames cost
+# far more context than speech, so visual sessions slide their window sooner.
+DEFAULT_COMPRESSION = (25600, 12800)
+MODE_COMPRESSION = {
+    "screen": (16384, 8192),
+    "camera": (20480, 10240),
+}
+
+
+def default_compression_policy(mode, modality):
+    """(trigger, target) for a session's video mode and reply modality; None disables compression"""
+    return MODE_COMPRESSION.get(mode, DEFAULT_COMPRESSION)
+
+
+_compression_policy = default_compression_policy
+
+
+def set_compression_policy(policy):
+    """Install policy(mode, modality) -> (trigger, target) | None for new sessions"""
+    global _compression_policy
+    _compression_policy = policy or default_compression_policy
+
+
+def compression_for(mode="none", modality="audio"):
+    return _compression_policy(mode, modality)
+
+
+def build_config(input_transcription=False, tools=None, modality="audio", compression=DEFAULT_COMPRESSION,
+                 resumption_handle=None):
+    """Per-session Live config; input_transcription streams the user's words back,
+    tools is a list of function-declaration groups the model may call,
+    modality="text" skips speech synthesis entirely, compression is
+    (trigger_tokens, target_tokens) or None and resumption_handle continues
+    an earlier connection's conversation"""
+    speech_config = None
+    if modality == "audio":
+        speech_config = types.SpeechConfig(
+            language_code="en-US",
+            voice_config=types.VoiceConfig(
+                prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name="Aoede")
+            )
         )
-    ),
-    context_window_compression=types.ContextWindowCompressionConfig(
-        trigger_tokens=25600,
-        sliding_window=types.SlidingWindow(target_tokens=12800),
-    ),
-)
+    return types.LiveConnectConfig(
+        response_modalities=[
+            "AUDIO" if modality == "audio" else "TEXT",
+        ],
+        media_resolution="MEDIA_RESOLUTION_LOW",
+        speech_config=speech_config,
+        context_window_compression=types.ContextWindowCompressionConfig(
+            trigger_tokens=compression[0],
+            sliding_window=types.SlidingWindow(target_tokens=compression[1]),
+        ) if compression else None,
+        input_audio_transcription=types.AudioTranscriptionConfig() if input_transcription else None,
+        tools=tools,
+        session_resumption=types.SessionResumptionConfig(handle=resumption_handle),
+    )
+
+
+CONFIG = build_config()
 
 class GeminiClient:
     def __init__(self):
-        self.client = client
+        self.client = None if LOOPBACK else get_client()
 
-    def connect(self):
+    def connect(self, config=None):
         """Return async context manager for Gemini Live session"""
-        return self.client.aio.live.connect(model=MODEL, config=CONFIG)
+        if LOOPBACK:
+            return loopback.connect(config or CONFIG)
+        return self.client.aio.live.connect(model=MODEL, config=config or CONFIG)
 
     # async def send(self, session, data, end_of_turn=False):
     #     if isinstance(data, str):
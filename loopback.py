@@ -0,0 +1,139 @@
+# loopback.py
+"""
+Local stand-in for a Gemini Live session, for load tests and benchmarks.
+
+Set GEMINI_LOOPBACK=1 and GeminiClient.connect() returns this instead of a
+real connection. It speaks the subset of the session API SessionManager
+uses and answers every user turn after a fixed latency:
+
+  - audio input: a turn ends after `silence` seconds without audio chunks,
+    the reply is `reply_ms` of 24 kHz PCM in 40 ms chunks
+  - text input (send_client_content with turn_complete=True): the reply is
+    streamed as text deltas, or as audio when the session is in audio mode
+
+Nothing here talks to the network.
+"""
+import asyncio
+import contextlib
+import os
+import time
+from types import SimpleNamespace
+
+RECEIVE_SAMPLE_RATE = 24000
+CHUNK_MS = 40
+REPLY_TEXT = "Sure - here is a short answer from the loopback model, streamed word by word."
+
+
+def _response(data=None, text=None, usage_metadata=None):
+    return SimpleNamespace(
+        data=data, text=text, server_content=None, tool_call=None,
+        tool_call_cancellation=None, usage_metadata=usage_metadata,
+    )
+
+
+def _usage(prompt_audio, prompt_image, prompt_text, response_tokens, response_modality):
+    prompt = prompt_audio + prompt_image + prompt_text
+    detail = lambda modality, count: SimpleNamespace(modality=modality, token_count=count)
+    return SimpleNamespace(
+        prompt_token_count=prompt, response_token_count=response_tokens,
+        cached_content_token_count=0, thoughts_token_count=0, tool_use_prompt_token_count=0,
+        total_token_count=prompt + response_tokens,
+        prompt_tokens_details=[detail("AUDIO", prompt_audio), detail("IMAGE", prompt_image),
+                               detail("TEXT", prompt_text)],
+        response_tokens_details=[detail(response_modality, response_tokens)],
+    )
+
+
+class LoopbackSession:
+    def __init__(self, config=None, latency=None, reply_ms=None, silence=0.5):
+        modalities = [str(m).upper() for m in (getattr(config, "response_modalities", None) or ["AUDIO"])]
+        self.audio_out = any("AUDIO" in m for m in modalities)
+        self.latency = float(os.environ.get("LOOPBACK_LATENCY", 0.3)) if latency is None else latency
+        self.reply_ms = int(os.environ.get("LOOPBACK_REPLY_MS", 1000)) if reply_ms is None else reply_ms
+        self.silence = silence
+        self.turns = asyncio.Queue()
+        self.bytes_in = 0
+        self.messages_in = 0
+        # Context so far, in tokens, for usage_metadata (rough Live API rates)
+        self.audio_tokens = 0
+        self.image_tokens = 0
+        self.text_tokens = 0
+        self._last_audio = None
+        self._watch = None
+
+    # ------------------------------------------------------------------ input
+
+    async def send(self, input=None, end_of_turn=False):
+        self.messages_in += 1
+        if isinstance(input, dict):
+            data = input.get("data") or b""
+            self.bytes_in += len(data)
+            mime_type = str(input.get("mime_type", ""))
+            if mime_type.startswith("image"):
+                self.image_tokens += 258
+            if mime_type.startswith("audio"):
+                self.audio_tokens += max(1, len(data) // 1000)     # ~32 tokens/s of 16 kHz PCM
+                self._last_audio = time.monotonic()
+                if self._watch is None or self._watch.done():
+                    self._watch = asyncio.create_task(self._watch_silence())
+        elif isinstance(input, str):
+            self.bytes_in += len(input)
+            self.text_tokens += len(input) // 4 + 1
+            if end_of_turn:
+                self._queue_turn()
+
+    async def send_realtime_input(self, audio=None, video=None, media=None, text=None, **kwargs):
+        blob = audio or video or media
+        if blob is not None:
+            await self.send(input={"data": getattr(blob, "data", b""), "mime_type": getattr(blob, "mime_type", "")})
+
+    async def send_client_content(self, turns=None, turn_complete=True):
+        self.messages_in += 1
+        self.text_tokens += len(str(turns)) // 4 + 1
+        if turn_complete:
+            self._queue_turn()
+
+    async def send_tool_response(self, function_responses=None):
+        self.messages_in += 1
+
+    async def _watch_silence(self):
+        while time.monotonic() - self._last_audio < self.silence:
+            await asyncio.sleep(self.silence / 4)
+        self._queue_turn()
+
+    def _queue_turn(self):
+        self.turns.put_nowait(time.monotonic())
+
+    # ----------------------------------------------------------------- output
+
+    async def receive(self):
+        """Yields one turn of responses, like the real session.receive()"""
+        await self.turns.get()
+        await asyncio.sleep(self.latency)
+        if self.audio_out:
+            chunk = b"\x00\x00" * (RECEIVE_SAMPLE_RATE * CHUNK_MS // 1000)
+            for _ in range(max(1, self.reply_ms // CHUNK_MS)):
+                yield _response(data=chunk)
+                # Like the real service: faster than realtime, not all at once
+                await asyncio.sleep(CHUNK_MS / 1000 / 4)
+            usage = _usage(self.audio_tokens, self.image_tokens, self.text_tokens,
+                           self.reply_ms * 25 // 1000, "AUDIO")
+        else:
+            words = REPLY_TEXT.split(" ")
+            for word in words:
+                yield _response(text=word + " ")
+                await asyncio.sleep(0)
+            usage = _usage(self.audio_tokens, self.image_tokens, self.text_tokens, len(words), "TEXT")
+        # The reply becomes part of the context for the next turn
+        self.text_tokens += usage.response_token_count
+        yield _response(usage_metadata=usage)
+
+
+@contextlib.asynccontextmanager
+async def connect(config=None):
+    session = LoopbackSession(config)
+    try:
+        yield session
+    finally:
+        if session._watch is not None:
+            session._watch.cancel()
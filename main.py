@@ -2,32 +2,130 @@
 import asyncio
 import json
 import base64
+import os
+import signal
 import wave
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from typing import Dict, Optional
 from session_manager import SessionManager
+import codec
+from pipeline import Frame, Pipeline, PushSource, RecordTap, SessionOutputSource, SessionSink, WebSocketSink
+from usage import add_usage
+import recorder
+from uplink import get_scheduler
+from drain import Admission, CLOSE_RESTART, DRAIN_DEADLINE, reconnect_message
 import time
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Install the SIGTERM drain handler on the serving loop"""
+    global _loop
+    _loop = asyncio.get_running_loop()
+    try:
+        _loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(drain_and_exit()))
+    except (NotImplementedError, RuntimeError):
+        pass  # not the main thread / platform without signal support: use the control command
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 class ClientSession:
     def __init__(self, websocket: WebSocket):
         self.websocket = websocket
         self.session_manager: Optional[SessionManager] = None
         self.mode: Optional[str] = None
-        self.gemini_audio_task: Optional[asyncio.Task] = None
+        # Response modality, "audio" (default) or "text"; negotiated via
+        # ?modality=text or a {"type": "config"} message before the first turn
+        self.modality = "audio"
+        # Tenant for upstream bandwidth sharing (?tenant=...); None = the session itself
+        self.tenant: Optional[str] = websocket.query_params.get("tenant")
+        # Media pipelines (see pipeline.py): client -> Gemini and Gemini -> client
+        self.audio_in: Optional[PushSource] = None
+        self.media_in: Optional[PushSource] = None
+        self.turns_in: Optional[PushSource] = None
+        self.ingress: Optional[Pipeline] = None
+        self.egress: Optional[Pipeline] = None
+        self.run_task: Optional[asyncio.Task] = None
+        # Set once a drain has told this client to reconnect
+        self.draining = False
+        # Opt-in capture of everything crossing /ws (see recorder.py)
+        self.recorder: Optional[recorder.Recorder] = None
         self.expecting_audio_data = False
         self.audio_length = 0
         self.last_audio_time = time.time()
 
 active_sessions: Dict[str, ClientSession] = {}
 
+MODALITIES = ("audio", "text")
+
+# Session recording: per connection with ?record=1, or every session with RECORD_SESSIONS=1
+RECORD_DIR = os.environ.get("RECORD_DIR", "recordings")
+RECORD_ALL = bool(os.environ.get("RECORD_SESSIONS"))
+
+# Optional RAG store for speculative prefetch; set RAG_PATH to enable
+_rag = None
+
+def get_rag():
+    global _rag
+    if _rag is None and os.environ.get("RAG_PATH"):
+        from rag import RAG
+        _rag = RAG(os.environ["RAG_PATH"])
+    return _rag
+
+# Optional APIManager whose tools the Live model can call; set ENABLE_TOOLS=1
+_api = None
+
+def get_api():
+    global _api
+    if _api is None and os.environ.get("ENABLE_TOOLS"):
+        from api import APIManager
+        from gemini_client import API_KEY
+        _api = APIManager(API_KEY)
+    return _api
+
+# Graceful drain (see drain.py): set by SIGTERM or the cluster "drain" command
+draining = False
+drain_report: Dict[str, float] = {}
+admission = Admission()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def turn_away(websocket: WebSocket, session_id: Optional[str], delay: float = 0.0):
+    """Tell a client to reconnect later and close its socket"""
+    try:
+        await websocket.send_text(codec.encode(reconnect_message(session_id, delay)))
+        await websocket.close(code=CLOSE_RESTART)
+    except Exception:
+        pass
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     
-    client_id = f"{websocket.client.host}:{websocket.client.port}"
+    # Resumable clients pass ?session_id=... so the cluster front can route
+    # them back to the same worker (see cluster.py)
+    client_id = websocket.query_params.get("session_id") or f"{websocket.client.host}:{websocket.client.port}"
+    if draining:
+        await turn_away(websocket, websocket.query_params.get("session_id"))
+        return
+    # Smooth reconnect storms: each session gets an admission slot before it can connect to Gemini
+    wait = admission.reserve()
+    if wait is None:
+        await turn_away(websocket, websocket.query_params.get("session_id"), admission.backlog())
+        return
+    if wait:
+        await asyncio.sleep(wait)
     session = ClientSession(websocket)
+    if websocket.query_params.get("modality") in MODALITIES:
+        session.modality = websocket.query_params["modality"]
+    if RECORD_ALL or websocket.query_params.get("record") == "1":
+        session.recorder = recorder.Recorder.for_session(
+            RECORD_DIR, client_id, {"session_id": client_id, "modality": session.modality},
+        )
     active_sessions[client_id] = session
     
     print(f"✅ Client connected: {client_id}")
@@ -46,7 +144,129 @@ async def websocket_endpoint(websocket: WebSocket):
     finally:
         receive_task.cancel()
         await cleanup_session(session)
-        del active_sessions[client_id]
+        if session.recorder:
+            await session.recorder.aclose()
+        if active_sessions.get(client_id) is session:
+            del active_sessions[client_id]
+
+
+def session_stats() -> dict:
+    """Cheap snapshot of this process's sessions, used by /stats and the cluster control channel"""
+    modes: Dict[str, int] = {}
+    modalities: Dict[str, int] = {}
+    prefetch: Dict[str, float] = {}
+    usage: Dict[str, int] = {}
+    usage_by_mode: Dict[str, dict] = {}
+    frames: Dict[str, int] = {}
+    per_session = []
+    for client_id, s in list(active_sessions.items()):
+        key = s.mode or "idle"
+        modes[key] = modes.get(key, 0) + 1
+        modalities[s.modality] = modalities.get(s.modality, 0) + 1
+        if s.session_manager:
+            stats = s.session_manager.stats()
+            for name, value in stats.get("prefetch", {}).items():
+                if name != "hit_rate":
+                    prefetch[name] = prefetch.get(name, 0) + value
+            add_usage(usage, stats["usage"])
+            for name in ("received", "forwarded", "image_tokens_saved"):
+                frames[name] = frames.get(name, 0) + stats.get("frames", {}).get(name, 0)
+            add_usage(usage_by_mode.setdefault(key, {}), stats["usage"])
+            per_session.append((stats["usage"]["total"], client_id, key))
+    if prefetch.get("turns"):
+        prefetch["hit_rate"] = prefetch["hits"] / prefetch["turns"]
+    return {
+        "pid": os.getpid(),
+        "sessions": len(active_sessions),
+        "modes": modes,
+        "modalities": modalities,
+        "prefetch": prefetch,
+        "usage": usage,
+        "usage_by_mode": usage_by_mode,
+        "frames": frames,
+        # Most expensive sessions by total tokens
+        "uplink": get_scheduler().stats(),
+        "draining": draining,
+        "admission": admission.stats(),
+        **({"drain": drain_report} if drain_report else {}),
+        "top_sessions": [
+            {"session": client_id, "mode": mode, "total_tokens": total}
+            for total, client_id, mode in sorted(per_session, reverse=True)[:5]
+        ],
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return session_stats()
+
+
+async def drain(deadline: float = DRAIN_DEADLINE) -> dict:
+    """
+    Stop taking sessions and move every client off this process: idle
+    sessions are told to reconnect right away, busy ones once their turn is
+    done, the rest when the deadline passes.
+    """
+    global draining
+    if draining:
+        return drain_report
+    draining = True
+    start = time.monotonic()
+    sessions = len(active_sessions)
+    print(f"🚰 Draining {sessions} sessions (deadline {deadline:.0f}s)")
+    drain_report.update({"sessions": sessions, "graceful": 0, "cut": 0})
+
+    async def release(client_id: str, session: ClientSession, cut: bool):
+        session.draining = True
+        drain_report["cut" if cut else "graceful"] += 1
+        await turn_away(session.websocket, client_id)
+
+    while True:
+        expired = time.monotonic() - start >= deadline
+        pending = [
+            (client_id, s) for client_id, s in list(active_sessions.items()) if not s.draining
+        ]
+        if not pending:
+            break
+        for client_id, s in pending:
+            busy = s.session_manager is not None and s.session_manager.busy()
+            if expired or not busy:
+                await release(client_id, s, cut=busy)
+        if expired:
+            break
+        await asyncio.sleep(0.1)
+
+    drain_report["seconds"] = round(time.monotonic() - start, 2)
+    print(f"🚰 Drained: {drain_report}")
+    return drain_report
+
+
+def request_drain(deadline: float = DRAIN_DEADLINE):
+    """Thread-safe entry point for the cluster control channel"""
+    if _loop is None:
+        raise RuntimeError("server not started")
+    asyncio.run_coroutine_threadsafe(drain(deadline), _loop)
+
+
+async def drain_and_exit():
+    await drain()
+    # Hand over to uvicorn's own shutdown (it still handles SIGINT)
+    os.kill(os.getpid(), signal.SIGINT)
+
+
+@app.get("/stats/sessions")
+async def stats_sessions():
+    """Full per-session counters (latency, usage, compression, prefetch, tools)"""
+    return {
+        client_id: {
+            "mode": s.mode,
+            **s.session_manager.stats(),
+            "pipeline": {p.name: p.stats() for p in (s.ingress, s.egress) if p},
+            **({"recording": s.recorder.stats()} if s.recorder else {}),
+        }
+        for client_id, s in list(active_sessions.items())
+        if s.session_manager
+    }
 
 
 async def receive_messages(session: ClientSession, websocket: WebSocket):
@@ -67,22 +287,44 @@ async def receive_messages(session: ClientSession, websocket: WebSocket):
 async def handle_json_message(session: ClientSession, message_text: str):
     """Handle JSON messages from client"""
     try:
-        data = json.loads(message_text)
-        msg_type = data.get("type")
+        msg = codec.decode(message_text)
+        msg_type = msg.type
+        # Media and typed turns are recorded by the ingress RecordTap
+        if session.recorder and msg_type not in ("ping", "audio", "text", *codec.MEDIA_TYPES):
+            session.recorder.record(recorder.CONTROL_IN, message_text)
         
-        if msg_type == "audio":
+        if msg_type == "ping":
+            # Liveness / load-test probe, answered without touching Gemini
+            await session.websocket.send_text(codec.encode({"type": "pong", "t": msg.get("t")}))
+
+        elif msg_type == "config":
+            modality = msg.get("modality")
+            if modality in MODALITIES and modality != session.modality:
+                session.modality = modality
+                # A running session was connected with the old modality
+                if session.session_manager:
+                    await start_session(session, session.mode)
+                print(f"⚙️ Modality set to {modality}")
+
+        elif msg_type == "text":
+            text = msg.get("text")
+            if text:
+                await ensure_session_mode(session, "audio")
+                session.turns_in.push(Frame.text(text))
+
+        elif msg_type == "audio":
             # Audio header - expect binary data next
             session.expecting_audio_data = True
-            session.audio_length = data.get("length", 0)
+            session.audio_length = msg.length
             
         elif msg_type == "screen":
             # Don't block - process in background
             await ensure_session_mode(session, "screen")
-            await handle_screen_frame(session, data)
+            await handle_screen_frame(session, msg)
             
         elif msg_type == "video":
             await ensure_session_mode(session, "camera")
-            await handle_video_frame(session, data)
+            await handle_video_frame(session, msg)
             
     except Exception as e:
         print(f"Error handling JSON message: {e}")
@@ -105,8 +347,8 @@ async def ensure_session_mode(session: ClientSession, required_mode: str):
     elif session.mode != backend_mode and backend_mode in ["screen", "video"]:
         # Just update mode for visual modes
         session.mode = backend_mode
-        if hasattr(session.session_manager, 'video'):
-            session.session_manager.video.video_mode = backend_mode
+        # May reconnect (between turns) when the new mode has another compression policy
+        session.session_manager.set_mode("camera" if backend_mode == "video" else backend_mode)
 
 
 async def handle_audio_data(session: ClientSession, audio_data: bytes):
@@ -120,30 +362,22 @@ async def handle_audio_data(session: ClientSession, audio_data: bytes):
         time_since_last = current_time - session.last_audio_time
         session.last_audio_time = current_time
         
-        await session.session_manager.enqueue_audio(audio_data)
+        session.audio_in.push(Frame.audio(audio_data))
         print(f"🎤 Audio chunk: {len(audio_data)} bytes (interval: {time_since_last:.3f}s)")
 
 
-async def handle_screen_frame(session: ClientSession, data: dict):
+async def handle_screen_frame(session: ClientSession, frame: codec.MediaFrame):
     """Handle screen capture frames without blocking audio"""
     if session.session_manager:
-        frame_data = {
-            "mime_type": data.get("mime_type", "image/jpeg"),
-            "data": data.get("data")
-        }
-        # Don't await - let it process in background
-        asyncio.create_task(session.session_manager.enqueue_video(frame_data))
+        # The frame is queued as-is; its payload is only sliced out when sent
+        session.media_in.push(Frame.image(frame))
         print(f"🖥️ Screen frame received")
 
 
-async def handle_video_frame(session: ClientSession, data: dict):
+async def handle_video_frame(session: ClientSession, frame: codec.MediaFrame):
     """Handle video frames without blocking audio"""
     if session.session_manager:
-        frame_data = {
-            "mime_type": data.get("mime_type", "image/jpeg"),
-            "data": data.get("data")
-        }
-        asyncio.create_task(session.session_manager.enqueue_video(frame_data))
+        session.media_in.push(Frame.image(frame))
         print(f"📹 Video frame received")
 
 
@@ -161,52 +395,54 @@ async def start_session(session: ClientSession, mode: str):
     video_mode = video_mode_map.get(mode, "none")
     
     # Create session manager with optimized settings
-    session.session_manager = SessionManager(mode=video_mode)
+    session.session_manager = SessionManager(
+        mode=video_mode, rag=get_rag(), api=get_api(), modality=session.modality, tenant=session.tenant,
+    )
     session.mode = mode
     
     # Start the Gemini session
-    asyncio.create_task(session.session_manager.run())
-    
-    # Start high-priority audio sender
-    session.gemini_audio_task = asyncio.create_task(
-        send_gemini_audio_to_client(session)
-    )
-    
-    print(f"🚀 Started {mode} session")
+    sm = session.session_manager
+    session.run_task = asyncio.create_task(sm.run())
 
+    # Client audio, frames and typed turns get separate sources, so frame
+    # scoring never holds up audio and a burst of frames can't evict a turn
+    # (turns_in is unbounded: typed turns are never dropped); replies are
+    # pushed as they arrive
+    session.audio_in = PushSource("audio_in", maxsize=64)
+    session.media_in = PushSource("media_in", maxsize=16)
+    session.turns_in = PushSource("turns_in", maxsize=0)
+    taps_in = [RecordTap(session.recorder)] if session.recorder else []
+    taps_out = [RecordTap(session.recorder, outbound=True)] if session.recorder else []
+    session.ingress = Pipeline(
+        [session.audio_in, session.media_in, session.turns_in], taps_in, SessionSink(sm), name="ingress",
+    ).start()
+    session.egress = Pipeline(
+        [SessionOutputSource(sm)], taps_out, WebSocketSink(session.websocket), name="egress",
+    ).start()
 
-async def send_gemini_audio_to_client(session: ClientSession):
-    """Send audio from Gemini back to client with minimal latency"""
-    try:
-        while session.session_manager:
-            try:
-                # Don't use timeout - just check if queue has items
-                if not session.session_manager.audio.audio_in_queue.empty():
-                    audio_data = await session.session_manager.audio.audio_in_queue.get()
-                    
-                    if isinstance(audio_data, (bytes, bytearray, memoryview)):
-                        await session.websocket.send_bytes(bytes(audio_data))
-                        print(f"🔊 Sent audio to client: {len(audio_data)} bytes")
-                else:
-                    # Very short sleep to keep loop responsive
-                    await asyncio.sleep(0.001)
-                    
-            except Exception as e:
-                print(f"Error in audio send: {e}")
-                await asyncio.sleep(0.01)
-                
-    except asyncio.CancelledError:
-        print("Audio sender cancelled")
+    print(f"🚀 Started {mode} session ({session.modality} replies)")
 
 
 async def cleanup_session(session: ClientSession):
     """Clean up session resources"""
-    if session.gemini_audio_task:
-        session.gemini_audio_task.cancel()
+    for pipeline in (session.ingress, session.egress):
+        if pipeline:
+            await pipeline.stop()
+    if session.run_task:
+        session.run_task.cancel()
         try:
-            await session.gemini_audio_task
+            await session.run_task
         except asyncio.CancelledError:
             pass
+    session.ingress = None
+    session.egress = None
+    session.run_task = None
+
+    if session.session_manager:
+        tenant = session.session_manager.tenant
+        if not any(s is not session and s.session_manager and s.session_manager.tenant == tenant
+                   for s in active_sessions.values()):
+            get_scheduler().forget(tenant)
     
     session.session_manager = None
     session.mode = None
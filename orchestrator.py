@@ -0,0 +1,201 @@
+# orchestrator.py
+"""
+Runs an MCP controller plan as a DAG of agent steps.
+
+`manage_mcp` asks the controller for one handoff at a time, so a flow that
+touches three agents costs three serial LLM round trips plus the controller
+calls in between. Here the controller returns the whole plan up front and
+independent steps (e.g. `scheduler` and `wellness`) run concurrently, with a
+bound on parallel LLM calls. Each step receives the outputs of the steps it
+depends on; when a step fails, everything downstream of it is cancelled.
+
+The report carries the measured critical-path latency next to the serial
+baseline (sum of all step latencies) so the win is visible per flow.
+"""
+import asyncio
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+DEFAULT_MAX_PARALLEL = 4
+
+
+@dataclass
+class PlanStep:
+    id: str
+    agent: str
+    context: str
+    depends_on: List[str] = field(default_factory=list)
+
+
+@dataclass
+class StepResult:
+    id: str
+    agent: str
+    status: str = "pending"     # ok | failed | cancelled
+    output: Optional[str] = None
+    error: Optional[str] = None
+    started: float = 0.0
+    finished: float = 0.0
+
+    @property
+    def latency(self) -> float:
+        return self.finished - self.started if self.started else 0.0
+
+
+@dataclass
+class PlanReport:
+    results: Dict[str, StepResult]
+    wall_time: float
+    critical_path_latency: float
+    serial_latency: float
+    critical_path: List[str]
+
+    @property
+    def ok(self) -> bool:
+        return all(r.status == "ok" for r in self.results.values())
+
+    def summary(self) -> dict:
+        return {
+            "ok": self.ok,
+            "wall_time": round(self.wall_time, 3),
+            "critical_path_latency": round(self.critical_path_latency, 3),
+            "serial_latency": round(self.serial_latency, 3),
+            "critical_path": self.critical_path,
+            "steps": {
+                sid: {"agent": r.agent, "status": r.status, "latency": round(r.latency, 3), "error": r.error}
+                for sid, r in self.results.items()
+            },
+        }
+
+
+def _text(response) -> str:
+    return getattr(response, "content", response) or ""
+
+
+def parse_plan(text, known_agents=None) -> List[PlanStep]:
+    """Parse the controller's JSON plan (tolerates ```json fences) and validate it as a DAG"""
+    text = _text(text)
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        raise ValueError("Controller reply contains no JSON plan")
+    raw = json.loads(match.group(0))
+
+    items = raw.get("steps", [])
+    if not isinstance(items, list):
+        raise ValueError("Plan steps must be a list")
+
+    steps = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("agent"), str) or not item["agent"]:
+            raise ValueError(f"Plan step {i + 1} has no agent")
+        depends_on = item.get("depends_on", [])
+        if not isinstance(depends_on, list):
+            raise ValueError(f"Plan step {i + 1} has a malformed depends_on")
+        step = PlanStep(
+            id=str(item.get("id") or f"s{i + 1}"),
+            agent=item["agent"],
+            context=str(item.get("context", "")),
+            depends_on=[str(d) for d in depends_on],
+        )
+        if known_agents is not None and step.agent not in known_agents:
+            raise ValueError(f"Plan step {step.id} uses unknown agent {step.agent}")
+        steps.append(step)
+
+    ids = {s.id for s in steps}
+    if len(ids) != len(steps):
+        raise ValueError("Plan has duplicate step ids")
+    for s in steps:
+        missing = set(s.depends_on) - ids
+        if missing:
+            raise ValueError(f"Plan step {s.id} depends on unknown steps {sorted(missing)}")
+    topological_order(steps)
+    return steps
+
+
+def topological_order(steps: List[PlanStep]) -> List[str]:
+    """Kahn's algorithm; raises on cycles"""
+    indegree = {s.id: len(s.depends_on) for s in steps}
+    children: Dict[str, List[str]] = {s.id: [] for s in steps}
+    for s in steps:
+        for dep in s.depends_on:
+            children[dep].append(s.id)
+    ready = [sid for sid, n in indegree.items() if n == 0]
+    order = []
+    while ready:
+        sid = ready.pop()
+        order.append(sid)
+        for child in children[sid]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                ready.append(child)
+    if len(order) != len(steps):
+        raise ValueError("Plan has a dependency cycle")
+    return order
+
+
+def critical_path(steps: List[PlanStep], results: Dict[str, StepResult]):
+    """Longest latency-weighted path through the DAG -> (latency, [step ids])"""
+    by_id = {s.id: s for s in steps}
+    best: Dict[str, tuple] = {}
+    for sid in topological_order(steps):
+        own = results[sid].latency
+        prev = max((best[d] for d in by_id[sid].depends_on), default=(0.0, []), key=lambda b: b[0])
+        best[sid] = (prev[0] + own, prev[1] + [sid])
+    return max(best.values(), default=(0.0, []), key=lambda b: b[0])
+
+
+class Orchestrator:
+    def __init__(self, api_manager, max_parallel: int = DEFAULT_MAX_PARALLEL):
+        self.api = api_manager
+        self.semaphore = asyncio.Semaphore(max_parallel)
+
+    def _step_context(self, step: PlanStep, results: Dict[str, StepResult]) -> str:
+        if not step.depends_on:
+            return step.context
+        inputs = "\n".join(f"[{d} / {results[d].agent}]: {results[d].output}" for d in step.depends_on)
+        return f"{step.context}\n\nInputs from previous steps:\n{inputs}"
+
+    async def run(self, steps: List[PlanStep], user_name: str) -> PlanReport:
+        results = {s.id: StepResult(s.id, s.agent) for s in steps}
+        done = {s.id: asyncio.Event() for s in steps}
+
+        async def run_step(step: PlanStep):
+            try:
+                for dep in step.depends_on:
+                    await done[dep].wait()
+                failed = [d for d in step.depends_on if results[d].status != "ok"]
+                if failed:
+                    results[step.id].status = "cancelled"
+                    results[step.id].error = f"upstream step(s) {failed} did not complete"
+                    return
+
+                async with self.semaphore:
+                    results[step.id].started = time.perf_counter()
+                    try:
+                        response = await self.api.ahandle_request(
+                            step.agent, user_name, self._step_context(step, results)
+                        )
+                        results[step.id].output = _text(response)
+                        results[step.id].status = "ok"
+                    except asyncio.CancelledError:
+                        results[step.id].status = "cancelled"
+                        raise
+                    except Exception as e:
+                        results[step.id].status = "failed"
+                        results[step.id].error = str(e)
+                        print(f"[MCP] Step {step.id} ({step.agent}) failed: {e}")
+                    finally:
+                        results[step.id].finished = time.perf_counter()
+            finally:
+                done[step.id].set()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_step(s) for s in steps))
+        wall = time.perf_counter() - start
+
+        cp_latency, cp_steps = critical_path(steps, results)
+        serial = sum(r.latency for r in results.values())
+        return PlanReport(results, wall, cp_latency, serial, cp_steps)
@@ -0,0 +1,485 @@
+# pipeline.py
+"""
+Composable media pipeline: sources -> stages -> sink.
+
+Everything that moves media in or out of a SessionManager is expressed as
+one of three pieces, so the /ws server, the local CLI (cli.py) and
+recording replay (replay.py) share the same send/receive code:
+
+    Source   yields Frames        PushSource (fed by /ws), MicSource, CameraSource,
+                                  ScreenSource, StdinSource, ReplaySource,
+                                  SessionOutputSource (model output)
+    Stage    Frame -> Frames      RecordTap (capture to a recording), or your own
+    Sink     consumes Frames      SessionSink (into Gemini), WebSocketSink,
+                                  SpeakerSink, ConsoleSink, NullSink
+
+Frames are typed (audio / image / text / control) and carry their payload
+by reference: PCM stays the bytes or memoryview it arrived as, and images
+stay the lazily sliced codec.MediaFrame until the moment they are sent.
+Stages must not copy payloads they only inspect.
+
+A Pipeline runs each source in its own task and pushes every frame through
+the stages and into the sink inline, so a hop costs a function call rather
+than a queue. Every piece keeps frames/bytes in and out, drops, errors and
+time spent. Pipeline.stats() reports them per stage.
+"""
+import asyncio
+import base64
+import contextlib
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable, List, Optional
+
+import codec
+import recorder
+
+AUDIO, IMAGE, TEXT, CONTROL = "audio", "image", "text", "control"
+
+
+@dataclass(slots=True)
+class Frame:
+    kind: str
+    payload: Any = None     # bytes/memoryview (audio), base64 str or codec.MediaFrame (image), str (text), dict (control)
+    mime_type: str = ""
+    t: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def audio(cls, pcm, mime_type="audio/pcm"):
+        return cls(AUDIO, pcm, mime_type)
+
+    @classmethod
+    def image(cls, data, mime_type=None):
+        """From a codec.MediaFrame (kept lazy) or a base64 string"""
+        if isinstance(data, codec.MediaFrame):
+            return cls(IMAGE, data, mime_type or data.mime_type)
+        return cls(IMAGE, data, mime_type or "image/jpeg")
+
+    @classmethod
+    def text(cls, text):
+        return cls(TEXT, text, "text/plain")
+
+    @classmethod
+    def control(cls, type, **fields):
+        return cls(CONTROL, {"type": type, **fields})
+
+    @property
+    def data(self):
+        """Payload in send form; materialises a lazy MediaFrame"""
+        payload = self.payload
+        return payload.data if isinstance(payload, codec.MediaFrame) else payload
+
+    @property
+    def size(self) -> int:
+        payload = self.payload
+        if isinstance(payload, codec.MediaFrame):
+            return payload.size
+        if isinstance(payload, dict) or payload is None:
+            return 0
+        return len(payload)
+
+    @property
+    def blob(self) -> dict:
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+class StageStats:
+    __slots__ = ("frames_in", "frames_out", "bytes_in", "bytes_out", "dropped", "errors", "seconds")
+
+    def __init__(self):
+        self.frames_in = self.frames_out = 0
+        self.bytes_in = self.bytes_out = 0
+        self.dropped = self.errors = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> dict:
+        handled = self.frames_in or self.frames_out
+        return {
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "us_per_frame": round(self.seconds / handled * 1e6, 1) if handled else 0.0,
+        }
+
+
+class Stage:
+    """Transform: process() returns the frames to pass on (none drops the frame)"""
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name or type(self).__name__
+        self.stats = StageStats()
+
+    async def process(self, frame: Frame) -> Iterable[Frame]:
+        return (frame,)
+
+    async def close(self):
+        pass
+
+    async def _handle(self, frame: Frame) -> Iterable[Frame]:
+        stats = self.stats
+        stats.frames_in += 1
+        stats.bytes_in += frame.size
+        start = time.perf_counter()
+        try:
+            out = await self.process(frame)
+        except Exception as e:
+            stats.errors += 1
+            print(f"⚠️ Stage {self.name} failed: {e}")
+            out = ()
+        stats.seconds += time.perf_counter() - start
+        if not out:
+            stats.dropped += 1
+            return ()
+        for f in out:
+            stats.frames_out += 1
+            stats.bytes_out += f.size
+        return out
+
+
+class Source(Stage):
+    """Produces frames; frames() ends when the source is exhausted or closed"""
+
+    async def frames(self):
+        if False:
+            yield
+
+    def _emitted(self, frame: Frame):
+        self.stats.frames_out += 1
+        self.stats.bytes_out += frame.size
+
+
+class Sink(Stage):
+    """Consumes frames; write() is awaited, so a slow sink back-pressures its sources"""
+
+    async def write(self, frame: Frame):
+        pass
+
+    async def process(self, frame: Frame):
+        await self.write(frame)
+        return (frame,)
+
+
+class Pipeline:
+    def __init__(self, sources: List[Source], stages: List[Stage], sink: Sink, name: str = "pipeline"):
+        self.sources = sources
+        self.stages = stages
+        self.sink = sink
+        self.name = name
+        self._tasks = []
+
+    async def _push(self, frame: Frame):
+        frames = (frame,)
+        for stage in self.stages:
+            out = []
+            for f in frames:
+                out.extend(await stage._handle(f))
+            if not out:
+                return
+            frames = out
+        for f in frames:
+            await self.sink._handle(f)
+
+    async def _pump(self, source: Source):
+        try:
+            # aclosing: a cancelled pump runs the source's cleanup now, not at garbage collection
+            async with contextlib.aclosing(source.frames()) as frames:
+                async for frame in frames:
+                    source._emitted(frame)
+                    await self._push(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            source.stats.errors += 1
+            print(f"⚠️ {self.name}: source {source.name} failed: {e}")
+
+    def start(self):
+        """Run every source in its own task; returns self"""
+        self._tasks = [asyncio.create_task(self._pump(source)) for source in self.sources]
+        return self
+
+    async def run(self):
+        """Run until all sources are exhausted"""
+        self.start()
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for piece in (*self.sources, *self.stages, self.sink):
+            try:
+                await piece.close()
+            except Exception as e:
+                print(f"⚠️ {self.name}: closing {piece.name} failed: {e}")
+
+    def stats(self) -> dict:
+        return {piece.name: piece.stats.as_dict() for piece in (*self.sources, *self.stages, self.sink)}
+
+
+# -------------------------------------------------------------------- sources
+
+class PushSource(Source):
+    """Frames pushed by someone else (the /ws handler); drops the oldest when full, maxsize=0 never drops"""
+
+    def __init__(self, name="push", maxsize=64):
+        super().__init__(name)
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, frame: Frame):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.queue.get_nowait()
+            self.queue.put_nowait(frame)
+            self.stats.dropped += 1
+
+    async def frames(self):
+        while (frame := await self.queue.get()) is not None:
+            yield frame
+
+    async def close(self):
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+
+class MicSource(Source):
+    """Local microphone, 16 kHz PCM"""
+
+    async def frames(self):
+        import audio
+
+        stream = await asyncio.to_thread(audio.open_mic)
+        try:
+            while True:
+                yield Frame.audio(await asyncio.to_thread(stream.read, audio.CHUNK_SIZE, exception_on_overflow=False))
+        finally:
+            stream.close()
+
+
+class CameraSource(Source):
+    """Local camera, one JPEG every `interval` seconds"""
+
+    def __init__(self, interval=1.0, name=None):
+        super().__init__(name)
+        self.interval = interval
+
+    async def frames(self):
+        import cv2
+        import video
+
+        # Opening the camera takes about a second; keep it off the loop
+        cap = await asyncio.to_thread(cv2.VideoCapture, 0)
+        try:
+            while (blob := await asyncio.to_thread(video.capture_camera_frame, cap)) is not None:
+                yield Frame.image(blob["data"], blob["mime_type"])
+                await asyncio.sleep(self.interval)
+        finally:
+            cap.release()
+
+
+class ScreenSource(Source):
+    """Local screen capture every `interval` seconds"""
+
+    def __init__(self, interval=1.0, name=None):
+        super().__init__(name)
+        self.interval = interval
+
+    async def frames(self):
+        import video
+
+        while (blob := await asyncio.to_thread(video.capture_screen)) is not None:
+            yield Frame.image(blob["data"], blob["mime_type"])
+            await asyncio.sleep(self.interval)
+
+
+class StdinSource(Source):
+    """Typed turns from the terminal; "q" ends the source"""
+
+    async def frames(self):
+        while True:
+            text = await asyncio.to_thread(input, "message > ")
+            if text.lower() == "q":
+                return
+            if text.strip():
+                yield Frame.text(text)
+
+
+class ReplaySource(Source):
+    """Inbound records of a session recording, at recorded pace (speed 1), scaled, or as fast as possible (0)"""
+
+    def __init__(self, recording: "recorder.Recording", speed=1.0, name="replay"):
+        super().__init__(name)
+        self.recording = recording
+        self.speed = speed
+        self.lags = []
+        self.recorded_out = 0       # bytes the original session sent back
+
+    async def frames(self):
+        start = time.monotonic()
+        for record in self.recording.records():
+            if record.kind not in recorder.INBOUND:
+                self.recorded_out += len(record.payload)
+                continue
+            if self.speed > 0:
+                target = start + record.t / self.speed
+                delay = target - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.lags.append(max(0.0, time.monotonic() - target))
+            if record.kind == recorder.AUDIO_IN:
+                yield Frame.audio(record.payload)
+            elif record.kind == recorder.FRAME_IN:
+                frame_type, mime_type, data = record.frame()
+                # Same mode switch main.ensure_session_mode does for live frames
+                yield Frame.control("mode", mode=frame_type)
+                yield Frame.image(codec.MediaFrame(frame_type, mime_type, _data=base64.b64encode(data).decode()))
+            else:
+                msg = codec.decode(bytes(record.payload).decode())
+                if msg.type == "text" and msg.get("text"):
+                    yield Frame.text(msg.get("text"))
+
+
+class SessionOutputSource(Source):
+    """Model output of a SessionManager: audio chunks, or text deltas plus turn_complete controls"""
+
+    def __init__(self, session_manager, name="gemini"):
+        super().__init__(name)
+        self.sm = session_manager
+
+    async def frames(self):
+        sm = self.sm
+        text_mode = sm.text_out_queue is not None
+        queue = sm.text_out_queue if text_mode else sm.audio.audio_in_queue
+        while True:
+            item = await queue.get()
+            if not text_mode:
+                frame = Frame.audio(item, "audio/pcm;rate=24000")
+            else:
+                frame = Frame.control("turn_complete") if item is None else Frame.text(item)
+            # Off the queue but not yet delivered: SessionManager.busy() counts it.
+            # The generator resumes only once the sink is done with the frame.
+            sm.egress_in_flight += 1
+            try:
+                yield frame
+            finally:
+                sm.egress_in_flight -= 1
+
+
+# --------------------------------------------------------------------- stages
+
+class RecordTap(Stage):
+    """Copies frames into a recorder.Recorder and passes them on unchanged"""
+
+    def __init__(self, rec: "recorder.Recorder", outbound=False, name=None):
+        super().__init__(name or ("record_out" if outbound else "record_in"))
+        self.rec = rec
+        self.outbound = outbound
+
+    async def process(self, frame):
+        kind = frame.kind
+        if kind == AUDIO:
+            self.rec.record(recorder.AUDIO_OUT if self.outbound else recorder.AUDIO_IN, frame.payload)
+        elif self.outbound:
+            if kind == TEXT:
+                self.rec.record(recorder.CONTROL_OUT, codec.encode({"type": "text_delta", "text": frame.payload}))
+            elif kind == CONTROL:
+                self.rec.record(recorder.CONTROL_OUT, codec.encode(frame.payload))
+        elif kind == IMAGE:
+            payload = frame.payload
+            if isinstance(payload, codec.MediaFrame):
+                # The recorder slices and decodes the span on its writer thread;
+                # the frame itself stays lazy
+                self.rec.record(recorder.FRAME_IN, (payload.type, frame.mime_type, payload.span()))
+            else:
+                self.rec.record(recorder.FRAME_IN, ("video", frame.mime_type, payload))
+        elif kind == TEXT:
+            self.rec.record(recorder.CONTROL_IN, codec.encode({"type": "text", "text": frame.payload}))
+        return (frame,)
+
+
+# ---------------------------------------------------------------------- sinks
+
+class SessionSink(Sink):
+    """Feeds a SessionManager: audio, images, typed turns and mode switches"""
+
+    VIDEO_MODES = {"screen": "screen", "video": "camera", "camera": "camera"}
+
+    def __init__(self, session_manager, name="session"):
+        super().__init__(name)
+        self.sm = session_manager
+
+    async def write(self, frame):
+        kind = frame.kind
+        if kind == AUDIO:
+            payload = frame.payload
+            # The Live SDK wants bytes; replayed PCM is a view into the recording
+            await self.sm.enqueue_audio(payload if isinstance(payload, bytes) else bytes(payload))
+        elif kind == IMAGE:
+            payload = frame.payload
+            await self.sm.enqueue_video(payload if isinstance(payload, codec.MediaFrame) else frame.blob)
+        elif kind == TEXT:
+            await self.sm.send_text(frame.payload)
+        elif kind == CONTROL and frame.payload.get("type") == "mode":
+            mode = self.VIDEO_MODES.get(frame.payload.get("mode"))
+            if mode and mode != self.sm.video.video_mode:
+                self.sm.set_mode(mode)
+
+
+class WebSocketSink(Sink):
+    """Model output to a /ws client: PCM as binary messages, text as text_delta / turn_complete JSON"""
+
+    def __init__(self, websocket, name="websocket"):
+        super().__init__(name)
+        self.websocket = websocket
+
+    async def write(self, frame):
+        if frame.kind == AUDIO:
+            await self.websocket.send_bytes(bytes(frame.payload))
+        elif frame.kind == TEXT:
+            await self.websocket.send_text(codec.encode({"type": "text_delta", "text": frame.payload}))
+        elif frame.kind == CONTROL:
+            await self.websocket.send_text(codec.encode(frame.payload))
+
+
+class SpeakerSink(Sink):
+    """Local playback of 24 kHz model audio"""
+
+    def __init__(self, name="speaker"):
+        super().__init__(name)
+        self.stream = None
+
+    async def write(self, frame):
+        if frame.kind != AUDIO:
+            return
+        if self.stream is None:
+            import audio
+
+            self.stream = await asyncio.to_thread(audio.open_speaker)
+        await asyncio.to_thread(self.stream.write, bytes(frame.payload))
+
+    async def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class ConsoleSink(Sink):
+    """Prints streamed text replies"""
+
+    async def write(self, frame):
+        if frame.kind == TEXT:
+            print(frame.payload, end="", flush=True)
+        elif frame.kind == CONTROL and frame.payload.get("type") == "turn_complete":
+            print()
+
+
+class NullSink(Sink):
+    """Counts and discards"""
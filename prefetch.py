@@ -0,0 +1,116 @@
+# prefetch.py
+"""
+Speculative RAG prefetch from live input transcription.
+
+While the user is still talking, the Live session streams partial input
+transcripts. Each new fragment restarts a short debounce timer; when it
+fires, a RAG query for the transcript so far is started (cancelling any
+older one still running). At end of speech the freshest finished result is
+handed to SessionManager, which injects it into the session as context, so
+retrieval latency overlaps the user's speech instead of adding to the turn.
+End of speech is the transcription's `finished` flag; a turn that completes
+without one is expired as a miss, so every utterance is counted once.
+"""
+import asyncio
+import time
+
+DEBOUNCE = 0.25         # seconds of transcript quiet before querying
+MIN_CHARS = 12          # don't query on a word or two
+TOP_K = 3
+
+
+class SpeculativePrefetcher:
+    def __init__(self, rag, top_k=TOP_K, debounce=DEBOUNCE, min_chars=MIN_CHARS):
+        self.rag = rag
+        self.top_k = top_k
+        self.debounce = debounce
+        self.min_chars = min_chars
+
+        self.transcript = ""
+        self._task = None           # debounce + query task for the latest transcript
+        self._ready = None          # (transcript, results, latency)
+
+        self.turns = 0
+        self.hits = 0               # results were ready at end of speech
+        self.fresh_hits = 0         # ...and covered the whole final transcript
+        self.misses = 0
+        self.queries = 0
+        self.cancelled = 0
+        self.errors = 0
+        self.hidden_latency = 0.0   # retrieval seconds overlapped with speech
+
+    def on_partial(self, text: str):
+        """Feed an input transcription fragment"""
+        if not text:
+            return
+        self.transcript += text
+        if len(self.transcript.strip()) < self.min_chars:
+            return
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            self.cancelled += 1
+        self._task = asyncio.create_task(self._query(self.transcript))
+        self._task.add_done_callback(self._query_done)
+
+    def _query_done(self, task):
+        if task.cancelled():
+            return
+        if (e := task.exception()) is not None:
+            self.errors += 1
+            print(f"⚠️ RAG prefetch failed: {e}")
+
+    async def _query(self, transcript: str):
+        await asyncio.sleep(self.debounce)
+        self.queries += 1
+        start = time.perf_counter()
+        results = await self.rag.aquery_docs(transcript, self.top_k)
+        self._ready = (transcript, results, time.perf_counter() - start)
+
+    def end_of_speech(self):
+        """Called on the finished transcription of an utterance; returns prefetched results or None"""
+        if not self.transcript:
+            return None
+        self.turns += 1
+        ready, final = self._ready, self.transcript
+        self.reset()
+        if ready is None or not ready[1]:
+            self.misses += 1
+            return None
+        transcript, results, latency = ready
+        self.hits += 1
+        self.hidden_latency += latency
+        if transcript.strip() == final.strip():
+            self.fresh_hits += 1
+        return results
+
+    def expire(self):
+        """Turn finished without an end-of-speech signal: count it as a miss"""
+        if self.transcript:
+            self.turns += 1
+            self.misses += 1
+        self.reset()
+
+    def reset(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        self._ready = None
+        self.transcript = ""
+
+    @staticmethod
+    def format_context(results) -> str:
+        lines = [f"- {r['text']}" for r in results]
+        return "Relevant notes for the user's request (use if helpful):\n" + "\n".join(lines)
+
+    def stats(self) -> dict:
+        return {
+            "turns": self.turns,
+            "hits": self.hits,
+            "fresh_hits": self.fresh_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / self.turns if self.turns else 0.0,
+            "queries": self.queries,
+            "cancelled": self.cancelled,
+            "errors": self.errors,
+            "hidden_latency_ms": round(self.hidden_latency * 1000, 1),
+        }
@@ -21,4 +21,20 @@ mcp_controller_prompt = PromptTemplate(
         "Current status: {status}\n\n"
         "Determine the next best action or agent handoff."
     )
-)
\ No newline at end of file
+)
+
+# MCP Planner Prompt - asks the controller for the whole handoff graph at once
+mcp_plan_prompt = PromptTemplate(
+    input_variables=["agent_name", "goal", "status", "agents"],
+    template=(
+        "You are an Agent Coordinator managing an MCP.\n"
+        "Agent '{agent_name}' has the goal: {goal}.\n"
+        "Current status: {status}\n"
+        "Available agents: {agents}\n\n"
+        "Plan the agent handoffs needed to reach the goal. Steps that do not need "
+        "each other's output must not depend on each other so they can run in parallel.\n"
+        "Reply with JSON only, in this shape:\n"
+        '{{"steps": [{{"id": "s1", "agent": "<agent>", "context": "<what this agent should do>", '
+        '"depends_on": []}}]}}'
+    )
+)
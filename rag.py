@@ -1,18 +1,563 @@
 # rag.py
-from sentence_transformers import SentenceTransformer
+"""
+Retrieval store: FAISS vectors + SQLite document store.
+
+With `path=None` everything stays in memory (the old behaviour). With a
+path, the store lives in a directory:
+
+    manifest.json      segment list and next document id
+    seg-000001.faiss   immutable index segments, opened memory-mapped
+    docs.sqlite        id -> text / metadata
+
+New documents go into an in-memory tail index; `save()` writes the tail out
+as a new segment, so appends never rebuild what is already on disk.
+Segments are opened with mmap so every worker process shares the same page
+cache pages instead of holding a private copy.
+
+Small flat segments are merged in size tiers (MERGE_FACTOR adjacent ones of
+the same tier at a time), so each vector is copied O(log n) times. Exhaustive
+search gets slow as the corpus grows, so when the index family picked by size
+changes (choose_index_spec: flat, then HNSW, then IVF, optionally IVF-PQ with
+compress=True), or the flat segments outgrow REBUILD_GROWTH of the ANN one,
+everything is rebuilt into one index. Merges run in a background thread. Raw
+vectors are kept next to each segment (vec-*.f32) so rebuilds are exact.
+Tune recall/latency with set_search_params(nprobe=..., ef_search=...).
+
+The embedding model is shared per process (embeddings.py). From the async
+server use aquery/aquery_docs/aadd_doc, which never block the event loop.
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
 import faiss
 import numpy as np
 
+import embeddings
+from embeddings import EMBED_DIM
+EMBED_BATCH_SIZE = 256
+
+# Index selection by corpus size (see choose_index_spec)
+FLAT_MAX = 50_000           # exhaustive search is fast enough below this
+HNSW_MAX = 2_000_000        # graph index up to here, IVF beyond (memory)
+MERGE_FACTOR = 4            # flat segments of one size tier merged together
+MAX_SEGMENTS = 32           # hard cap when tiers don't line up
+REBUILD_GROWTH = 0.25       # flat rows beyond this share of the ANN segment get folded into it
+TRAIN_PER_LIST = 64         # IVF/PQ training rows per inverted list
+TRAIN_MIN = 10_000
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+
+def _read_index(path: str, mmap: bool):
+    """Open a segment memory-mapped when this faiss build supports it"""
+    if mmap:
+        for flag in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+            if hasattr(faiss, flag):
+                try:
+                    flags = getattr(faiss, flag) | getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+                    return faiss.read_index(path, flags)
+                except RuntimeError:
+                    continue
+    return faiss.read_index(path)
+
+
+class DocStore:
+    """id -> (text, metadata) in SQLite; ':memory:' when the RAG is not persistent"""
+
+    def __init__(self, path=":memory:"):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS docs (id INTEGER PRIMARY KEY, text TEXT, metadata TEXT)"
+            )
+
+    def put_many(self, ids, texts, metadatas):
+        rows = [
+            (int(i), t, json.dumps(m) if m is not None else None)
+            for i, t, m in zip(ids, texts, metadatas)
+        ]
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?, ?)", rows)
+
+    def get_many(self, ids):
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT id, text, metadata FROM docs WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        return {i: (t, json.loads(m) if m else None) for i, t, m in rows}
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class Segment:
+    """One immutable index covering ids [base_id, base_id + index.ntotal)"""
+
+    def __init__(self, index, base_id: int, file: str = None, vectors=None, spec: str = "Flat",
+                 vectors_file: str = None):
+        self.index = index
+        self.base_id = base_id
+        self.file = file
+        self.vectors = vectors          # raw float32 rows, source of truth for rebuilds
+        self.vectors_file = vectors_file
+        self.spec = spec
+
+
+def _family(spec: str) -> str:
+    for family in ("HNSW", "IVF"):
+        if spec.startswith(family):
+            return family
+    return "Flat"
+
+
+def ivf_nlist(n: int) -> int:
+    return int(min(65536, max(256, 4 * np.sqrt(n))))
+
+
+def choose_index_spec(n: int, compress: bool = False) -> str:
+    """faiss index_factory string for a corpus of n vectors"""
+    if n < FLAT_MAX:
+        return "Flat"
+    if compress:
+        return f"IVF{ivf_nlist(n)},PQ{EMBED_DIM // 8}"
+    if n >= HNSW_MAX:
+        return f"IVF{ivf_nlist(n)},Flat"
+    return "HNSW32"
+
+
+def training_sample(sources, size: int):
+    """Evenly spaced rows across a list of (possibly memory-mapped) arrays"""
+    total = sum(len(s) for s in sources)
+    if total <= size:
+        return np.ascontiguousarray(np.concatenate(sources), dtype="float32")
+    step = total / size
+    picks, offset = [], 0
+    for src in sources:
+        rows = np.arange(int(np.ceil(offset / step)) * step, offset + len(src), step).astype("int64") - offset
+        if len(rows):
+            picks.append(np.asarray(src[rows]))
+        offset += len(src)
+    return np.ascontiguousarray(np.concatenate(picks), dtype="float32")
+
+
+def build_index(spec: str, dim: int, sources, chunk: int = 100_000):
+    """Create, train (IVF/PQ) and fill an index from a list of vector arrays"""
+    index = faiss.index_factory(dim, spec)
+    if not index.is_trained:
+        match = re.match(r"IVF(\d+)", spec)
+        nlist = int(match.group(1)) if match else 1
+        index.train(training_sample(sources, max(TRAIN_MIN, TRAIN_PER_LIST * nlist)))
+    for src in sources:
+        for start in range(0, len(src), chunk):
+            index.add(np.ascontiguousarray(src[start:start + chunk], dtype="float32"))
+    return index
+
+
+def set_search_params(index, nprobe: int = None, ef_search: int = None):
+    """Apply nprobe / efSearch where the index type has them"""
+    family = _family_of(index)
+    if family == "IVF" and nprobe:
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", nprobe)
+    elif family == "HNSW" and ef_search:
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", ef_search)
+
+
+def _family_of(index) -> str:
+    name = type(index).__name__
+    if "HNSW" in name:
+        return "HNSW"
+    if "IVF" in name:
+        return "IVF"
+    return "Flat"
+
+
 class RAG:
-    def __init__(self):
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
-        self.index = faiss.IndexFlatL2(384)  # embedding size
+    def __init__(self, path=None, model=None, mmap=True, batch_size=EMBED_BATCH_SIZE,
+                 compress=False, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH, auto_rebuild=True):
+        self.path = path
+        self.mmap = mmap
+        self.batch_size = batch_size
+        self.compress = compress
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.auto_rebuild = auto_rebuild
+        self.dim = EMBED_DIM
+        self._model = model
+        self.segments = []
+        self.next_id = 0
+        self._seq = 0
+        self.lock = threading.RLock()
+        self._rebuild_thread = None
+        self._queued_rebuild = None     # {"spec": ...} asked for while a merge was running
+        self.rebuild_stats = {"rebuilds": 0, "merges": 0, "last_spec": None, "last_seconds": None}
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self.store = DocStore(os.path.join(path, "docs.sqlite"))
+            self._load_manifest()
+        else:
+            self.store = DocStore()
+
+        self.tail = faiss.IndexFlatL2(self.dim)  # embedding size
+        self.tail_base = self.next_id
 
-    def add_doc(self, text: str):
-        vec = self.model.encode([text])
-        self.index.add(np.array(vec, dtype="float32"))
+    @property
+    def model(self):
+        # Process-wide model, loaded on first use so opening a store is cheap
+        return self._model or embeddings.get_model()
+
+    @property
+    def ntotal(self) -> int:
+        return self.next_id
+
+    @property
+    def index_spec(self) -> str:
+        return self.segments[0].spec if self.segments else "Flat"
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """Tune recall vs. latency for IVF (nprobe) and HNSW (efSearch) segments"""
+        with self.lock:
+            self.nprobe = nprobe or self.nprobe
+            self.ef_search = ef_search or self.ef_search
+            for seg in self.segments:
+                set_search_params(seg.index, self.nprobe, self.ef_search)
+
+    # ----------------------------------------------------------- persistence
+
+    def _manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    def _load_manifest(self):
+        if not os.path.exists(self._manifest_path()):
+            return
+        with open(self._manifest_path()) as f:
+            manifest = json.load(f)
+        self.dim = manifest.get("dim", EMBED_DIM)
+        self.next_id = manifest["next_id"]
+        self._seq = manifest.get("seq", len(manifest["segments"]))
+        for seg in manifest["segments"]:
+            index = _read_index(os.path.join(self.path, seg["file"]), self.mmap)
+            set_search_params(index, self.nprobe, self.ef_search)
+            vectors = None
+            if seg.get("vectors"):
+                vectors = np.memmap(os.path.join(self.path, seg["vectors"]), dtype="float32",
+                                    mode="r").reshape(-1, self.dim)
+            self.segments.append(Segment(index, seg["base_id"], seg["file"], vectors,
+                                         seg.get("spec", "Flat"), seg.get("vectors")))
+
+    def _write_manifest(self):
+        manifest = {
+            "dim": self.dim,
+            "next_id": self.next_id,
+            "seq": self._seq,
+            "segments": [
+                {"file": s.file, "vectors": s.vectors_file, "base_id": s.base_id,
+                 "count": s.index.ntotal, "spec": s.spec}
+                for s in self.segments
+            ],
+        }
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._manifest_path())
+
+    def _persist_segment(self, seg: Segment, sources) -> Segment:
+        """Write index + raw vectors to disk and reopen both memory-mapped"""
+        with self.lock:
+            self._seq += 1
+            seq = self._seq
+        seg.file = f"seg-{seq:06d}.faiss"
+        seg.vectors_file = f"vec-{seq:06d}.f32"
+        faiss.write_index(seg.index, os.path.join(self.path, seg.file))
+        with open(os.path.join(self.path, seg.vectors_file), "wb") as f:
+            for src in sources:
+                for start in range(0, len(src), 100_000):
+                    f.write(np.ascontiguousarray(src[start:start + 100_000], dtype="float32").tobytes())
+        seg.index = _read_index(os.path.join(self.path, seg.file), self.mmap)
+        set_search_params(seg.index, self.nprobe, self.ef_search)
+        seg.vectors = np.memmap(os.path.join(self.path, seg.vectors_file), dtype="float32",
+                                mode="r").reshape(-1, self.dim)
+        return seg
+
+    def _remove_files(self, seg: Segment):
+        for name in (seg.file, seg.vectors_file):
+            if name:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+
+    def _segment_vectors(self, seg: Segment):
+        if seg.vectors is not None:
+            return seg.vectors
+        return seg.index.reconstruct_n(0, seg.index.ntotal)  # stores written before vector files
+
+    def save(self):
+        """Seal the in-memory tail as a new segment (written to disk and mmap'd when persistent)"""
+        with self.lock:
+            self.store.commit()
+            if self.tail.ntotal == 0:
+                return
+            vectors = self.tail.reconstruct_n(0, self.tail.ntotal)
+            seg = Segment(self.tail, self.tail_base, vectors=vectors)
+            if self.path:
+                self._persist_segment(seg, [vectors])
+            self.segments.append(seg)
+            self.tail = faiss.IndexFlatL2(self.dim)
+            self.tail_base = self.next_id
+            if self.path:
+                self._write_manifest()
+        self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        if not self.auto_rebuild or self.rebuilding:
+            return
+        with self.lock:
+            job = self._plan_merge()
+        if job:
+            self._start_merges(job)
+
+    def _plan_merge(self):
+        """Next background job as (contiguous segments, spec or None for by size); caller holds the lock"""
+        segments = self.segments
+        if not segments:
+            return None
+        sizes = [seg.index.ntotal for seg in segments]
+        wanted = choose_index_spec(sum(sizes), self.compress)
+        if _family(wanted) != _family(self.index_spec):
+            return list(segments), None
+        start = 1 if _family(segments[0].spec) != "Flat" else 0
+        if start and sum(sizes[1:]) > REBUILD_GROWTH * sizes[0]:
+            return list(segments), None
+        # Size tiers of factor 4: ntotal 1-3, 4-15, 16-63, ...
+        tiers = [(max(n, 1).bit_length() - 1) // 2 for n in sizes]
+        for i in range(start, len(segments) - MERGE_FACTOR + 1):
+            if len(set(tiers[i:i + MERGE_FACTOR])) == 1:
+                return segments[i:i + MERGE_FACTOR], "Flat"
+        if len(segments) > MAX_SEGMENTS:
+            i = min(range(start, len(segments) - MERGE_FACTOR + 1), key=lambda j: sum(sizes[j:j + MERGE_FACTOR]))
+            return segments[i:i + MERGE_FACTOR], "Flat"
+        return None
+
+    @property
+    def rebuilding(self) -> bool:
+        return self._rebuild_thread is not None and self._rebuild_thread.is_alive()
+
+    def rebuild(self, spec: str = None, background: bool = True):
+        """
+        Merge all sealed segments into one index of the type chosen for the
+        corpus size (or `spec`). Queries keep using the old segments until the
+        new one is swapped in; documents added meanwhile land in later segments.
+        Asked for while a merge is running, the rebuild runs right after it.
+        """
+        if not background and self.rebuilding:
+            self._rebuild_thread.join()
+        with self.lock:
+            if self.rebuilding:
+                self._queued_rebuild = {"spec": spec}
+                print(f"[RAG] Rebuild ({spec or 'by size'}) queued behind the running merge")
+                return self._rebuild_thread
+            self.store.commit()
+            if self.tail.ntotal:
+                # Seal without re-entering _maybe_rebuild
+                auto, self.auto_rebuild = self.auto_rebuild, False
+                try:
+                    self.save()
+                finally:
+                    self.auto_rebuild = auto
+            snapshot = list(self.segments)
+        if not snapshot:
+            return None
+        if not background:
+            self._merge(snapshot, spec)
+            return None
+        return self._start_merges((snapshot, spec))
+
+    def _start_merges(self, job):
+        self._rebuild_thread = threading.Thread(target=self._merge_loop, args=(job,), name="rag-rebuild",
+                                                daemon=True)
+        self._rebuild_thread.start()
+        return self._rebuild_thread
+
+    def _merge_loop(self, job):
+        """Background thread: run job, then queued rebuilds and any merges that became due"""
+        while job:
+            self._merge(*job)
+            with self.lock:
+                queued, self._queued_rebuild = self._queued_rebuild, None
+                if queued is not None:
+                    job = (list(self.segments), queued["spec"])
+                else:
+                    job = self._plan_merge() if self.auto_rebuild else None
+
+    def _merge(self, run, spec=None):
+        """Replace the contiguous segments `run` by one index built from their raw vectors"""
+        start = time.perf_counter()
+        with self.lock:
+            full = run[0] is self.segments[0] and len(run) == len(self.segments)
+        sources = [self._segment_vectors(s) for s in run]
+        n = sum(len(src) for src in sources)
+        target = spec or choose_index_spec(n, self.compress)
+        index = build_index(target, self.dim, sources)
+        set_search_params(index, self.nprobe, self.ef_search)
+        merged = Segment(index, run[0].base_id, spec=target)
+        if self.path:
+            self._persist_segment(merged, sources)
+        else:
+            merged.vectors = np.concatenate(sources)
+        with self.lock:
+            i = next(k for k, seg in enumerate(self.segments) if seg is run[0])
+            self.segments[i:i + len(run)] = [merged]
+            if self.path:
+                self._write_manifest()
+        if self.path:
+            for seg in run:
+                self._remove_files(seg)
+        elapsed = time.perf_counter() - start
+        self.rebuild_stats = {
+            "rebuilds": self.rebuild_stats["rebuilds"] + full,
+            "merges": self.rebuild_stats["merges"] + (not full),
+            "last_spec": target,
+            "last_seconds": elapsed,
+        }
+        if full:
+            print(f"[RAG] Rebuilt {n} vectors as {target} in {elapsed:.1f}s")
+        else:
+            print(f"[RAG] Merged {len(run)} segments ({n} vectors) in {elapsed:.2f}s")
+
+    def compact(self):
+        """Merge all segments (and the tail) into a single segment, in the foreground"""
+        if self.rebuilding:
+            self._rebuild_thread.join()
+        self.rebuild(background=False)
+
+    def close(self):
+        # No new merges from here on: one started by save() could still be using the store
+        self.auto_rebuild = False
+        if self.rebuilding:
+            self._rebuild_thread.join()
+        self.save()
+        if self.rebuilding:
+            self._rebuild_thread.join()
+        self.store.close()
+
+    # ----------------------------------------------------------------- ingest
+
+    def embed(self, texts, use_cache=False):
+        """Blocking encode; queries use the shared LRU, bulk ingest skips it"""
+        if self._model is not None:
+            vecs = self._model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True)
+            return np.asarray(vecs, dtype="float32")
+        return embeddings.encode(texts, use_cache=use_cache, batch_size=self.batch_size)
+
+    def add_embeddings(self, vectors, texts, metadatas=None):
+        """Append precomputed embeddings with their documents; returns the new ids"""
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        metadatas = metadatas or [None] * len(texts)
+        with self.lock:
+            ids = list(range(self.next_id, self.next_id + len(texts)))
+            self.tail.add(vectors)
+            self.next_id += len(texts)
+            self.store.put_many(ids, texts, metadatas)
+        return ids
+
+    def add_docs(self, texts, metadatas=None):
+        """Embed and add many documents, in batches of batch_size"""
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(texts)
+        ids = []
+        chunk = self.batch_size * 16
+        for start in range(0, len(texts), chunk):
+            part = texts[start:start + chunk]
+            ids += self.add_embeddings(self.embed(part), part, metadatas[start:start + chunk])
+        return ids
+
+    def add_doc(self, text: str, metadata=None):
+        return self.add_docs([text], [metadata])[0]
+
+    # ------------------------------------------------------------------ query
+
+    def search(self, vecs, top_k=3):
+        """Search every segment + the tail and merge -> (I, D) like faiss"""
+        vecs = np.ascontiguousarray(vecs, dtype="float32")
+        all_d, all_i = [], []
+        with self.lock:
+            segments = [(s.index, s.base_id) for s in self.segments]
+            # add_embeddings appends to the tail in place, so it is only read under the lock;
+            # sealed segments never change and are searched outside it
+            if self.tail.ntotal:
+                D, I = self.tail.search(vecs, top_k)
+                all_d.append(D)
+                all_i.append(np.where(I >= 0, I + self.tail_base, -1))
+        if not segments and not all_d:
+            n = len(vecs)
+            return np.full((n, top_k), -1, dtype="int64"), np.full((n, top_k), np.inf, dtype="float32")
+
+        for index, base in segments:
+            D, I = index.search(vecs, top_k)
+            all_d.append(D)
+            all_i.append(np.where(I >= 0, I + base, -1))
+        D = np.concatenate(all_d, axis=1)
+        I = np.concatenate(all_i, axis=1)
+        D = np.where(I >= 0, D, np.inf)
+        order = np.argsort(D, axis=1)[:, :top_k]
+        return np.take_along_axis(I, order, axis=1), np.take_along_axis(D, order, axis=1)
 
     def query(self, text: str, top_k=3):
-        vec = self.model.encode([text])
-        D, I = self.index.search(np.array(vec, dtype="float32"), top_k)
-        return I, D
\ No newline at end of file
+        I, D = self.search(self.embed([text], use_cache=True), top_k)
+        return I, D
+
+    def query_docs(self, text: str, top_k=3):
+        """Like query() but returns the stored documents: [{id, text, metadata, distance}]"""
+        I, D = self.query(text, top_k)
+        return self.lookup(I[0], D[0])
+
+    def lookup(self, ids, distances):
+        docs = self.store.get_many([i for i in ids if i >= 0])
+        results = []
+        for i, d in zip(ids, distances):
+            if i < 0 or int(i) not in docs:
+                continue
+            doc_text, metadata = docs[int(i)]
+            results.append({"id": int(i), "text": doc_text, "metadata": metadata, "distance": float(d)})
+        return results
+
+    # ------------------------------------------------------------ async API
+
+    async def _aembed(self, text: str, use_cache: bool):
+        if self._model is not None:
+            return (await asyncio.to_thread(self.embed, [text], use_cache))[0]
+        return await embeddings.batcher.aencode(text, use_cache)
+
+    async def aquery(self, text: str, top_k=3):
+        """Non-blocking query: micro-batched embedding, search on a worker thread"""
+        vec = await self._aembed(text, use_cache=True)
+        return await asyncio.to_thread(self.search, vec[None, :], top_k)
+
+    async def aquery_docs(self, text: str, top_k=3):
+        I, D = await self.aquery(text, top_k)
+        return await asyncio.to_thread(self.lookup, I[0], D[0])
+
+    async def aadd_doc(self, text: str, metadata=None):
+        vec = await self._aembed(text, use_cache=False)
+        ids = await asyncio.to_thread(self.add_embeddings, vec[None, :], [text], [metadata])
+        return ids[0]
+
+    async def aadd_docs(self, texts, metadatas=None):
+        return await asyncio.to_thread(self.add_docs, texts, metadatas)
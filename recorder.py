@@ -0,0 +1,293 @@
+# recorder.py
+"""
+Session capture in a compact, append-only, chunk-indexed file.
+
+A recording holds everything that crossed /ws for one session, stamped with
+monotonic nanoseconds since the start of the session:
+
+    AUDIO_IN     raw PCM from the client
+    FRAME_IN     screen/camera frame: b"<type>\\0<mime_type>\\0" + decoded image bytes
+    CONTROL_IN   other JSON control messages from the client, as UTF-8
+    AUDIO_OUT    model PCM sent to the client
+    CONTROL_OUT  JSON sent to the client (text deltas, turn markers)
+
+Layout (little endian):
+
+    header   MAGIC, u32 meta length, meta JSON
+    chunk    CHUNK_MAGIC, u32 record count, u32 body length, u64 first t_ns, body
+    body     records of u64 t_ns, u8 kind, u32 length, payload
+    footer   u64 offset, u64 first t_ns, u32 count per chunk, then
+             u32 chunk count, u64 index offset, FOOTER_MAGIC
+
+The footer is written by close(). A file from a crashed process has no
+footer, and readers rebuild the index by walking the chunk headers.
+
+Recorder.record() only appends a reference to an in-memory batch, so it is
+cheap to call from the event loop. Batches are flushed once they reach
+FLUSH_BYTES, or FLUSH_INTERVAL after their first record. Each flush becomes
+one chunk. The chunk is encoded (frames are base64-decoded) and written on a
+single shared writer thread.
+"""
+import asyncio
+import base64
+import json
+import mmap
+import os
+import re
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+MAGIC = b"GLREC\x00\x01\x00"
+CHUNK_MAGIC = b"CHNK"
+FOOTER_MAGIC = b"GLRECIDX"
+
+AUDIO_IN, FRAME_IN, CONTROL_IN, AUDIO_OUT, CONTROL_OUT = range(1, 6)
+KIND_NAMES = {AUDIO_IN: "audio_in", FRAME_IN: "frame_in", CONTROL_IN: "control_in",
+              AUDIO_OUT: "audio_out", CONTROL_OUT: "control_out"}
+INBOUND = (AUDIO_IN, FRAME_IN, CONTROL_IN)
+
+RECORD = struct.Struct("<QBI")
+CHUNK = struct.Struct("<4sIIQ")
+INDEX_ENTRY = struct.Struct("<QQI")
+FOOTER = struct.Struct("<IQ8s")
+
+FLUSH_BYTES = 256 * 1024
+FLUSH_INTERVAL = 0.5        # seconds
+
+# One writer thread for every recorder in the process keeps chunk order per file
+writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recorder")
+
+
+def _frame_size(data) -> int:
+    """base64 length of a FRAME_IN payload"""
+    if isinstance(data, tuple):
+        return data[2] - data[1]
+    return len(data or "")
+
+
+def _payload(kind, obj) -> bytes:
+    """Runs on the writer thread: turn whatever record() got into bytes"""
+    if kind == FRAME_IN:
+        frame_type, mime_type, data = obj
+        if isinstance(data, tuple):
+            text, start, end = data     # codec.MediaFrame.span(): sliced here, off the event loop
+            data = text[start:end]
+        return f"{frame_type}\0{mime_type}\0".encode() + base64.b64decode(data or "")
+    if isinstance(obj, str):
+        return obj.encode()
+    return bytes(obj)
+
+
+class Recorder:
+    """Append-only writer for one session"""
+
+    def __init__(self, path, meta=None):
+        self.path = path
+        self.meta = dict(meta or {})
+        self.meta.setdefault("started_at", time.time())
+        self.t0 = time.monotonic_ns()
+        self.records = 0
+        self.chunks = 0
+        self.closed = False
+        self._batch = []            # (t_ns, kind, obj)
+        self._batch_bytes = 0
+        self._flush_handle = None
+        self._index = []            # (offset, first t_ns, count); only touched on the writer thread
+        self._file = None
+        self._pending = None        # future of the latest write
+        self._submit(self._open)
+
+    @classmethod
+    def for_session(cls, directory, session_id, meta=None):
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", session_id)
+        return cls(os.path.join(directory, f"{name}-{int(time.time())}.rec"), meta)
+
+    def record(self, kind, obj):
+        """Queue one record: bytes, str, or (type, mime_type, base64 str or (text, start, end)) for FRAME_IN"""
+        if self.closed:
+            return
+        self._batch.append((time.monotonic_ns() - self.t0, kind, obj))
+        self.records += 1
+        self._batch_bytes += _frame_size(obj[2]) * 3 // 4 if kind == FRAME_IN else len(obj)
+        if self._batch_bytes >= FLUSH_BYTES:
+            self.flush()
+        elif self._flush_handle is None:
+            try:
+                self._flush_handle = asyncio.get_running_loop().call_later(FLUSH_INTERVAL, self.flush)
+            except RuntimeError:
+                pass  # no loop: the batch goes out with the next size-triggered flush or close()
+
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._batch, self._batch_bytes = self._batch, [], 0
+        if batch:
+            self.chunks += 1
+            self._submit(self._write_chunk, batch)
+
+    def close(self):
+        """Flush and write the index; returns a future that resolves when the file is complete"""
+        if self.closed:
+            return self._pending
+        self.flush()
+        self.closed = True
+        return self._submit(self._finish)
+
+    async def aclose(self):
+        await asyncio.wrap_future(self.close())
+
+    def stats(self) -> dict:
+        return {"path": self.path, "records": self.records, "chunks": self.chunks}
+
+    # ----------------------------------------------------------- writer thread
+
+    def _submit(self, fn, *args):
+        self._pending = writer.submit(fn, *args)
+        return self._pending
+
+    def _open(self):
+        meta = json.dumps(self.meta).encode()
+        self._file = open(self.path, "wb")
+        self._file.write(MAGIC + struct.pack("<I", len(meta)) + meta)
+
+    def _write_chunk(self, batch):
+        parts = []
+        for t_ns, kind, obj in batch:
+            try:
+                payload = _payload(kind, obj)
+            except Exception as e:
+                print(f"⚠️ Recorder skipped a {KIND_NAMES.get(kind)} record: {e}")
+                continue
+            parts.append(RECORD.pack(t_ns, kind, len(payload)))
+            parts.append(payload)
+        body = b"".join(parts)
+        offset = self._file.tell()
+        self._file.write(CHUNK.pack(CHUNK_MAGIC, len(parts) // 2, len(body), batch[0][0]) + body)
+        self._file.flush()
+        self._index.append((offset, batch[0][0], len(parts) // 2))
+
+    def _finish(self):
+        index_offset = self._file.tell()
+        self._file.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in self._index))
+        self._file.write(FOOTER.pack(len(self._index), index_offset, FOOTER_MAGIC))
+        self._file.close()
+        print(f"💾 Recorded {self.records} records in {len(self._index)} chunks to {self.path}")
+
+
+# ------------------------------------------------------------------- reading
+
+@dataclass(slots=True)
+class Record:
+    t_ns: int
+    kind: int
+    payload: memoryview     # view into the mapped file, valid until Recording.close()
+
+    @property
+    def t(self) -> float:
+        return self.t_ns / 1e9
+
+    def frame(self):
+        """(type, mime_type, image bytes view) of a FRAME_IN record"""
+        raw = self.payload
+        first = bytes(raw[:64]).index(b"\0")
+        second = bytes(raw[first + 1:first + 129]).index(b"\0") + first + 1
+        return bytes(raw[:first]).decode(), bytes(raw[first + 1:second]).decode(), raw[second + 1:]
+
+
+class Recording:
+    """Memory-mapped reader; iterating yields Records without copying payloads"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        (meta_len,) = struct.unpack_from("<I", self._map, len(MAGIC))
+        self._data_start = len(MAGIC) + 4 + meta_len
+        self.meta = json.loads(bytes(self._map[len(MAGIC) + 4:self._data_start]))
+        self.index = self._read_footer()
+        self.complete = self.index is not None
+        if self.index is None:
+            self.index = self._scan()
+
+    def _read_footer(self):
+        size = len(self._map)
+        if size < self._data_start + FOOTER.size:
+            return None
+        count, index_offset, magic = FOOTER.unpack_from(self._map, size - FOOTER.size)
+        if magic != FOOTER_MAGIC or index_offset + count * INDEX_ENTRY.size != size - FOOTER.size:
+            return None
+        return [INDEX_ENTRY.unpack_from(self._map, index_offset + i * INDEX_ENTRY.size) for i in range(count)]
+
+    def _scan(self):
+        """Rebuild the chunk index of a recording that was never closed"""
+        index, offset, size = [], self._data_start, len(self._map)
+        while offset + CHUNK.size <= size:
+            magic, count, body_len, first_t = CHUNK.unpack_from(self._map, offset)
+            if magic != CHUNK_MAGIC or offset + CHUNK.size + body_len > size:
+                break  # torn tail from a crash
+            index.append((offset, first_t, count))
+            offset += CHUNK.size + body_len
+        return index
+
+    def __len__(self):
+        return sum(count for _, _, count in self.index)
+
+    @property
+    def duration(self) -> float:
+        last = None
+        for record in self.chunk_records(len(self.index) - 1) if self.index else ():
+            last = record
+        return last.t if last else 0.0
+
+    def chunk_records(self, i):
+        offset, _, count = self.index[i]
+        pos = offset + CHUNK.size
+        for _ in range(count):
+            t_ns, kind, length = RECORD.unpack_from(self._map, pos)
+            pos += RECORD.size
+            yield Record(t_ns, kind, self._view[pos:pos + length])
+            pos += length
+
+    def records(self, kinds=None, start=0.0):
+        """Records in time order, optionally filtered by kind and starting at `start` seconds"""
+        start_ns = int(start * 1e9)
+        for i, (_, first_t, _) in enumerate(self.index):
+            # Skip whole chunks that end before `start`
+            if i + 1 < len(self.index) and self.index[i + 1][1] < start_ns:
+                continue
+            for record in self.chunk_records(i):
+                if record.t_ns >= start_ns and (kinds is None or record.kind in kinds):
+                    yield record
+
+    __iter__ = records
+
+    def summary(self) -> dict:
+        counts, sizes = {}, {}
+        for record in self.records():
+            name = KIND_NAMES.get(record.kind, str(record.kind))
+            counts[name] = counts.get(name, 0) + 1
+            sizes[name] = sizes.get(name, 0) + len(record.payload)
+        return {"meta": self.meta, "complete": self.complete, "chunks": len(self.index),
+                "duration_s": round(self.duration, 3), "records": counts, "bytes": sizes,
+                "file_bytes": len(self._map)}
+
+    def close(self):
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            pass  # Record payloads still referenced; the map goes when they do
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,98 @@
+# replay.py
+"""
+Replay a session recording (see recorder.py) through SessionManager.
+
+The recording is a pipeline.ReplaySource: inbound audio, frames and typed
+turns go through the same SessionSink as live /ws traffic, with their
+recorded timing (--speed 1), scaled (--speed 4), or back to back (--speed 0).
+Model output is drained and counted like the /ws egress would send it. The
+report compares it with what was recorded and includes scheduling lag,
+per-stage pipeline counters and the session's latency and usage counters.
+
+With GEMINI_LOOPBACK=1 the model side is the local loopback backend, so
+replays are deterministic and make good performance regression inputs:
+
+    GEMINI_LOOPBACK=1 python replay.py recordings/<session>.rec --speed 0
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import recorder
+from pipeline import NullSink, Pipeline, RecordTap, ReplaySource, SessionOutputSource, SessionSink
+from session_manager import SessionManager
+
+VIDEO_MODES = {"screen": "screen", "video": "camera"}
+
+
+async def replay(path, speed=1.0, tail=2.0, record_to=None) -> dict:
+    with recorder.Recording(path) as rec:
+        first_frame = next(rec.records(kinds=(recorder.FRAME_IN,)), None)
+        mode = VIDEO_MODES.get(first_frame.frame()[0], "none") if first_frame else "none"
+        del first_frame
+        sm = SessionManager(mode=mode, modality=rec.meta.get("modality", "audio"))
+        run_task = asyncio.create_task(sm.run())
+        await asyncio.wait_for(sm.connected.wait(), timeout=30)
+
+        # Re-recording the replay gives a recording of the new model output
+        out = recorder.Recorder.for_session(record_to, "replay", dict(rec.meta)) if record_to else None
+        source = ReplaySource(rec, speed)
+        ingress = Pipeline([source], [RecordTap(out)] if out else [], SessionSink(sm), name="ingress")
+        # Model output is drained and counted like the /ws egress would send it
+        egress = Pipeline(
+            [SessionOutputSource(sm)], [RecordTap(out, outbound=True)] if out else [], NullSink("client"),
+            name="egress",
+        ).start()
+
+        start = time.monotonic()
+        await ingress.run()
+        elapsed = time.monotonic() - start
+        duration = rec.duration
+
+    # Let the last turn finish
+    await asyncio.sleep(tail)
+    await egress.stop()
+    run_task.cancel()
+    await asyncio.gather(run_task, return_exceptions=True)
+    if out:
+        await out.aclose()
+
+    lags = sorted(source.lags)
+    stats = sm.stats()
+    client = egress.sink.stats
+    return {
+        "recording": path,
+        "speed": speed,
+        "recorded_s": round(duration, 3),
+        "replayed_s": round(elapsed, 3),
+        "lag_ms": {
+            "p50": round(lags[len(lags) // 2] * 1000, 2) if lags else 0.0,
+            "max": round(lags[-1] * 1000, 2) if lags else 0.0,
+        },
+        "egress": {"bytes": client.bytes_in, "messages": client.frames_in, "recorded_bytes": source.recorded_out},
+        "pipeline": {"ingress": ingress.stats(), "egress": egress.stats()},
+        "model_latency": stats["model_latency"],
+        "usage": stats["usage"],
+        **({"rerecorded": out.path} if out else {}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, 0 = as fast as possible")
+    parser.add_argument("--tail", type=float, default=2.0, help="seconds to wait for output after the last input")
+    parser.add_argument("--info", action="store_true", help="print the recording summary and exit")
+    parser.add_argument("--record", metavar="DIR", help="record the replayed session (with the new replies) to DIR")
+    args = parser.parse_args()
+
+    if args.info:
+        with recorder.Recording(args.recording) as rec:
+            print(json.dumps(rec.summary(), indent=2))
+        return
+    print(json.dumps(asyncio.run(replay(args.recording, args.speed, args.tail, args.record)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,138 @@
 # session_manager.py
 import asyncio
+import time
 import traceback
-from gemini_client import GeminiClient
-from audio import AudioHandler
-from video import VideoHandler
+from gemini_client import GeminiClient, build_config, compression_for
+from audio import AudioHandler, SpeechDetector
+from video import FrameSelector, VideoHandler
+from codec import MediaFrame
+from prefetch import SpeculativePrefetcher
+from tools import LatencyStats, ToolExecutor, ToolRegistry
+from usage import UsageCounters
+from uplink import get_scheduler
 
 class SessionManager:
-    def __init__(self, mode="none"):
+    def __init__(self, mode="none", rag=None, api=None, modality="audio", tenant=None, uplink=None,
+                 frame_selection=True):
         self.gemini = GeminiClient()
-        self.audio = AudioHandler()
+        # "text" sessions get streamed text replies: no PyAudio, no audio queues
+        self.modality = modality
+        self.audio = AudioHandler() if modality == "audio" else None
         self.video = VideoHandler(mode)
-        self.text = TextHandler()
         self.session = None
-        
-        # Flags to control what data sources to use
-        self.use_frontend_video = True  # Use video from frontend instead of local capture
-        self.use_frontend_audio = True  # Use audio from frontend instead of local capture
+        self.connected = asyncio.Event()
+
+        # Voice activity on frontend audio, used to spot end of speech
+        self.speech = SpeechDetector()
+        # Camera mode: forward the sharpest frames around speech, sparse keyframes otherwise
+        self.frames = FrameSelector() if frame_selection else None
+        # Speculative retrieval from live input transcription (only with a RAG store)
+        self.prefetcher = SpeculativePrefetcher(rag) if rag is not None else None
+        # Live function calling routed to APIManager tools (only with an APIManager)
+        self.tools = ToolExecutor(ToolRegistry.from_api(api)) if api is not None else None
+
+        # Model latency: end of user speech / tool response -> first model output
+        self.model_latency = LatencyStats()
+        self._waiting_for_model_since = None
+        self._responding = False    # model output of the current turn is streaming
+        self.egress_in_flight = 0   # output taken off the queues, still being delivered (pipeline.py)
+
+        # Token usage reported by the Live API, and the compression thresholds
+        # this session connected with (chosen by gemini_client's policy hook).
+        # A mode switch that changes the policy reconnects between turns,
+        # resuming the same conversation through the latest resumption handle
+        # (deferred until the server has sent one).
+        self.usage = UsageCounters()
+        self.compression = compression_for(mode, modality)
+        self._reconfigure = asyncio.Event()
+        self.resumption_handle = None
+        self.reconnects = 0
+
+        # Upstream sends go through the process-wide scheduler: audio first,
+        # video shared fairly between tenants (a session is its own tenant by default)
+        self.uplink = uplink or get_scheduler()
+        self.tenant = tenant or f"session-{id(self)}"
 
         # OPTIMIZATION 1: Larger queue sizes for better buffering
-        self.audio.audio_in_queue = asyncio.Queue(maxsize=50)  # Increased for smooth playback
-        self.audio.out_queue = asyncio.Queue(maxsize=20)       # Increased for audio buffering
+        if self.audio:
+            self.audio.audio_in_queue = asyncio.Queue(maxsize=50)  # Increased for smooth playback
+            self.audio.out_queue = asyncio.Queue(maxsize=20)       # Increased for audio buffering
+            self.text_out_queue = None
+        else:
+            # Text deltas for the client; None marks turn complete
+            self.text_out_queue = asyncio.Queue(maxsize=100)
         self.video.out_queue = asyncio.Queue(maxsize=10)       # Reasonable size for video
     
     async def run(self):
+        """Connect and pump queues to and from Gemini; media gets in and out through pipeline.py"""
         try:
-            async with (
-                self.gemini.connect() as session,
-                asyncio.TaskGroup() as tg,
-            ):
-                self.session = session
-
-                # OPTIMIZATION 2: Split send_realtime into separate audio/video tasks
-                tg.create_task(self._send_audio_priority())
-                tg.create_task(self._send_video_background())
-                
-                # Only start local capture if not using frontend data
-                if not self.use_frontend_video:
-                    if self.video.video_mode == "camera":
-                        tg.create_task(self.video.get_frames())
-                    elif self.video.video_mode == "screen":
-                        tg.create_task(self.video.get_screen())
-                
-                if not self.use_frontend_audio:
-                    tg.create_task(self.audio.listen_audio())
-
-                # CHANGE 2: Replace receive_from_gemini with receive_audio
-                tg.create_task(self.receive_audio())
-                
-                # CHANGE 3: Add play_audio task - UNCOMMENTED for actual playback
-                # tg.create_task(self.audio.play_audio())
-                
-                # Keep running
-                await asyncio.Event().wait()
-
+            while True:
+                await self._run_connection()
+                self.reconnects += 1
+                print(f"🔁 Reconnecting with compression {self.compression}")
         except asyncio.CancelledError:
             print("Session cancelled")
         except ExceptionGroup as eg:  # CHANGE 4: Handle ExceptionGroup like reference
             print("Session error - ExceptionGroup:")
             traceback.print_exception(eg)
-            if hasattr(self.audio, 'audio_stream') and self.audio.audio_stream:
-                self.audio.audio_stream.close()
         except Exception as e:
             print(f"Session error: {e}")
             traceback.print_exc()
 
+    async def _run_connection(self):
+        """One Live connection; returns when it should be replaced by one with the current config"""
+        self._reconfigure.clear()
+        compression = self.compression
+        async with (
+            self.gemini.connect(build_config(
+                input_transcription=self.prefetcher is not None,
+                tools=self.tools.registry.live_tools() if self.tools else None,
+                modality=self.modality,
+                compression=self.compression,
+                resumption_handle=self.resumption_handle,
+            )) as session,
+            asyncio.TaskGroup() as tg,
+        ):
+            self.session = session
+            self.connected.set()
+
+            # OPTIMIZATION 2: Split send_realtime into separate audio/video tasks
+            tasks = [tg.create_task(self._send_video_background()), tg.create_task(self.receive_audio())]
+            if self.audio:
+                tasks.append(tg.create_task(self._send_audio_priority()))
+
+            # Keep running until the config has to change, then switch between turns.
+            # Without a resumption handle a new connection would start an empty
+            # conversation, so the switch waits until the server has sent one.
+            deferred = False
+            while True:
+                await self._reconfigure.wait()
+                if self.compression == compression:
+                    self._reconfigure.clear()   # switched back before the reconnect happened
+                    continue
+                if self.busy():
+                    await asyncio.sleep(0.1)
+                elif self.resumption_handle is None:
+                    if not deferred:
+                        print(f"⚠️ No resumption handle yet, keeping compression {compression} "
+                              f"until the conversation can be carried over")
+                        deferred = True
+                    await asyncio.sleep(0.1)
+                else:
+                    break
+            self.connected.clear()
+            for task in tasks:
+                task.cancel()
+
+    def set_mode(self, mode: str):
+        """Switch video mode ("none", "screen", "camera"); reconnects between turns if the
+        compression policy changes, once the conversation can be resumed on the new connection"""
+        self.video.video_mode = mode
+        compression = compression_for(mode, self.modality)
+        if compression != self.compression:
+            self.compression = compression
+            self._reconfigure.set()
+
     # OPTIMIZATION 3: Split into high-priority audio and low-priority video
     async def _send_audio_priority(self):
         """High-priority audio sender - no timeouts for minimal latency"""
@@ -71,7 +140,11 @@ class SessionManager:
         while True:
             try:
                 msg = await self.audio.out_queue.get()  # No timeout - wait for audio
-                await self.session.send(input=msg)
+                queued_at = None
+                if isinstance(msg, tuple):
+                    queued_at, msg = msg
+                async with self.uplink.audio(self.tenant, len(msg["data"]), queued_at):
+                    await self.session.send(input=msg)
                 
                 consecutive_packets += 1
                 # Batch logging to reduce overhead
@@ -89,7 +162,18 @@ class SessionManager:
             try:
                 # Use short timeout to not block too long
                 frame = await asyncio.wait_for(self.video.out_queue.get(), timeout=0.05)
-                await self.session.send(input=frame)
+                queued_at = None
+                if isinstance(frame, tuple):
+                    queued_at, frame = frame
+                size = frame.size if isinstance(frame, MediaFrame) else len(frame["data"])
+                async with self.uplink.video(self.tenant, size, queued_at) as granted:
+                    if not granted:
+                        print("⚠️ Uplink busy, dropped stale video frame")
+                        continue
+                    if isinstance(frame, MediaFrame):
+                        # Frontend frames: payload is materialised here, once
+                        frame = frame.blob
+                    await self.session.send(input=frame)
                 print(f"→ Sent {frame['mime_type']} to Gemini")
             except asyncio.TimeoutError:
                 # No video available, yield to other tasks
@@ -98,14 +182,6 @@ class SessionManager:
                 print(f"Error sending video: {e}")
                 await asyncio.sleep(0.1)
 
-    # Keep original method for compatibility but mark as deprecated
-    async def send_realtime(self):
-        """[DEPRECATED] Use _send_audio_priority and _send_video_background instead"""
-        await asyncio.gather(
-            self._send_audio_priority(),
-            self._send_video_background()
-        )
-
     # OPTIMIZATION 4: Improved receive with overflow protection
     async def receive_audio(self):
         """Background task to read from websocket and write pcm chunks to output queue"""
@@ -115,8 +191,35 @@ class SessionManager:
                 # Get a turn from the session
                 turn = self.session.receive()
                 async for response in turn:
+                    if response.usage_metadata:
+                        self.usage.add(response.usage_metadata)
+                    update = getattr(response, "session_resumption_update", None)
+                    if update and update.resumable and update.new_handle:
+                        self.resumption_handle = update.new_handle
+
+                    server_content = response.server_content
+                    if self.prefetcher and server_content and server_content.input_transcription:
+                        transcription = server_content.input_transcription
+                        self.prefetcher.on_partial(transcription.text)
+                        if transcription.finished:
+                            await self._on_end_of_speech()
+
+                    # Tool calls run beside this loop so a slow tool never stalls audio
+                    if self.tools and response.tool_call:
+                        self.tools.dispatch(self.session, response.tool_call, on_sent=self._mark_waiting_for_model)
+                        continue
+                    if self.tools and response.tool_call_cancellation:
+                        self.tools.cancel(response.tool_call_cancellation.ids)
+                        continue
+
+                    if response.data or response.text:
+                        self._responding = True
+                        if self._waiting_for_model_since is not None:
+                            self.model_latency.add(time.perf_counter() - self._waiting_for_model_since)
+                            self._waiting_for_model_since = None
+
                     # Handle audio data
-                    if data := response.data:
+                    if self.audio and (data := response.data):
                         # OPTIMIZATION 5: Use put_nowait with overflow protection
                         try:
                             self.audio.audio_in_queue.put_nowait(data)
@@ -138,10 +241,19 @@ class SessionManager:
                     
                     # Handle text responses
                     if text := response.text:
-                        print(f"← Gemini: {text}")
+                        if self.text_out_queue is not None:
+                            await self.text_out_queue.put(text)
+                        else:
+                            print(f"← Gemini: {text}")
 
                 # Turn complete - clear audio queue for interruptions
                 print("--- Turn Complete ---")
+                self._responding = False
+                if self.prefetcher:
+                    self.prefetcher.expire()
+                if self.text_out_queue is not None:
+                    await self.text_out_queue.put(None)
+                    continue
                 # OPTIMIZATION 6: More efficient queue clearing
                 cleared = 0
                 while not self.audio.audio_in_queue.empty():
@@ -157,13 +269,85 @@ class SessionManager:
                 print(f"Error receiving from Gemini: {e}")
                 await asyncio.sleep(0.1)
 
+    async def _on_end_of_speech(self):
+        """Inject prefetched retrieval results before the model answers"""
+        if not self.prefetcher or not self.session:
+            return
+        results = self.prefetcher.end_of_speech()
+        if results:
+            try:
+                await self.session.send_client_content(
+                    turns={"role": "user", "parts": [{"text": self.prefetcher.format_context(results)}]},
+                    turn_complete=False,
+                )
+                print(f"📚 Injected {len(results)} prefetched documents")
+            except Exception as e:
+                print(f"Error injecting RAG context: {e}")
+
+    async def send_text(self, text: str):
+        """Typed user turn (either modality)"""
+        try:
+            # The first message of a session usually races the connect
+            await asyncio.wait_for(self.connected.wait(), timeout=10)
+        except asyncio.TimeoutError:
+            print("⚠️ Gemini session not connected, dropping text")
+            return
+        await self.session.send_client_content(
+            turns={"role": "user", "parts": [{"text": text}]},
+            turn_complete=True,
+        )
+        self._mark_waiting_for_model()
+
+    def _mark_waiting_for_model(self):
+        if self._waiting_for_model_since is None:
+            self._waiting_for_model_since = time.perf_counter()
+
+    def busy(self) -> bool:
+        """A turn is in flight: user speaking, reply owed or streaming, or not yet sent to the client"""
+        if self.speech.speaking or self._waiting_for_model_since is not None or self._responding:
+            return True
+        if self.egress_in_flight:
+            return True
+        queue = self.audio.audio_in_queue if self.audio else self.text_out_queue
+        return not queue.empty()
+
+    def stats(self) -> dict:
+        """Per-session counters for /stats"""
+        stats = {
+            "mode": self.video.video_mode,
+            "modality": self.modality,
+            "model_latency": self.model_latency.as_dict(),
+            "usage": self.usage.as_dict(),
+            "compression": list(self.compression) if self.compression else None,
+            "reconnects": self.reconnects,
+        }
+        if self.frames and self.frames.received:
+            stats["frames"] = self.frames.stats()
+        if self.prefetcher:
+            stats["prefetch"] = self.prefetcher.stats()
+        if self.tools:
+            stats["tools"] = self.tools.stats()
+        return stats
+
     # OPTIMIZATION 7: Add overflow protection for enqueue methods
     async def enqueue_audio(self, data: bytes):
-        """Called by websocket to push raw PCM audio from frontend"""
-        audio_packet = {
+        """Raw 16 kHz PCM from a pipeline source (frontend, mic or replay)"""
+        if not self.audio:
+            return
+        event = self.speech.update(data)
+        if event == "end":
+            # Prefetch injection waits for the transcription's own end of turn,
+            # so each utterance is counted once
+            self._mark_waiting_for_model()
+        if event and self._selecting_frames():
+            for frame in (self.frames.speech_start() if event == "start" else self.frames.speech_end()):
+                self._put_video(frame)
+
+        # Timestamped so the uplink scheduler can report queueing delay
+        audio_packet = (time.perf_counter(), {
             "data": data, 
             "mime_type": "audio/pcm"
-        }
+        })
         
         try:
             # Try non-blocking put first
@@ -178,34 +362,36 @@ class SessionManager:
                 # If all else fails, use blocking put
                 await self.audio.out_queue.put(audio_packet)
 
-    async def enqueue_video(self, data: dict):
-        """Called by websocket to push video/screen frames from frontend"""
+    async def enqueue_video(self, data):
+        """Screen/camera frame (codec.MediaFrame or blob dict) from a pipeline source"""
         # Validate frame data
-        if "mime_type" in data and "data" in data:
-            try:
-                # Try non-blocking put first
-                self.video.out_queue.put_nowait(data)
-            except asyncio.QueueFull:
-                # Queue full - drop oldest frame
-                try:
-                    self.video.out_queue.get_nowait()
-                    self.video.out_queue.put_nowait(data)
-                    print("⚠️ Video queue full, dropped oldest frame")
-                except:
-                    # Skip this frame if we can't add it
-                    print("⚠️ Video queue blocked, skipping frame")
+        if isinstance(data, MediaFrame):
+            valid = data.size > 0
+        else:
+            valid = "mime_type" in data and "data" in data
+        if not valid:
+            print(f"⚠️ Invalid video frame format: {data.keys() if isinstance(data, dict) else data.type}")
+        elif self._selecting_frames():
+            for frame in await self.frames.add(data):
+                self._put_video(frame)
         else:
-            print(f"⚠️ Invalid video frame format: {data.keys()}")
+            self._put_video(data)
 
+    def _selecting_frames(self) -> bool:
+        return self.frames is not None and self.video.video_mode == "camera"
 
-class TextHandler:
-    """Handle text interactions (for testing)"""
-    def __init__(self):
-        pass
+    def _put_video(self, data):
+        item = (time.perf_counter(), data)
+        try:
+            # Try non-blocking put first
+            self.video.out_queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Queue full - drop oldest frame
+            try:
+                self.video.out_queue.get_nowait()
+                self.video.out_queue.put_nowait(item)
+                print("⚠️ Video queue full, dropped oldest frame")
+            except:
+                # Skip this frame if we can't add it
+                print("⚠️ Video queue blocked, skipping frame")
 
-    async def send_text(self, session):
-        while True:
-            text = await asyncio.to_thread(input, "message > ")
-            if text.lower() == "q":
-                break
-            await session.send(input=text or ".", end_of_turn=True)
\ No newline at end of file
@@ -0,0 +1,165 @@
+# tools.py
+"""
+Live API function calling routed to APIManager.
+
+The realtime model can call our tools (calendar, specialized agents) while a
+session is running. Calls are executed off the receive loop: every
+call in a `tool_call` message runs as its own task, concurrently (bounded
+per session, sync tools on a shared thread pool) and with its own timeout,
+so a cancellation only stops the calls it names. The results of the calls
+that were not cancelled go back as one tool response.
+Tool latency is tracked per tool, separately from model latency.
+"""
+import asyncio
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_TOOL_TIMEOUT = 20.0
+MAX_CONCURRENT_TOOLS = 4
+
+# Shared by every session for blocking tool functions
+tool_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool")
+
+
+class LatencyStats:
+    """count / total / max of a latency series, in seconds"""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 1) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 1),
+        }
+
+
+class ToolRegistry:
+    """Name -> (callable, timeout) plus the function declarations sent to Gemini"""
+    def __init__(self):
+        self.tools = {}
+        self.declarations = []
+
+    def register(self, name, fn, description, properties, required=(), timeout=DEFAULT_TOOL_TIMEOUT):
+        self.tools[name] = (fn, timeout)
+        self.declarations.append({
+            "name": name,
+            "description": description,
+            "parameters": {"type": "OBJECT", "properties": properties, "required": list(required)},
+        })
+
+    def live_tools(self):
+        return [{"function_declarations": self.declarations}] if self.declarations else None
+
+    @classmethod
+    def from_api(cls, api_manager, user_name="user"):
+        registry = cls()
+        registry.register(
+            "add_event", api_manager.add_event,
+            "Add an event to the user's calendar.",
+            {"title": {"type": "STRING"}, "time": {"type": "STRING", "description": "When, e.g. 'tomorrow 5pm'"}},
+            required=("title", "time"), timeout=5.0,
+        )
+
+        async def ask_agent(agent_name, request):
+            response = await api_manager.ahandle_request(agent_name, user_name, request)
+            return getattr(response, "content", response)
+
+        registry.register(
+            "ask_agent", ask_agent,
+            "Ask a specialized assistant for help: scheduler (calendar), "
+            "study_coach (focus and study plans) or wellness (exercise, food, calm).",
+            {"agent_name": {"type": "STRING", "enum": list(api_manager.agent_manager.agents)},
+             "request": {"type": "STRING"}},
+            required=("agent_name", "request"),
+        )
+        return registry
+
+
+class ToolExecutor:
+    """Runs one session's tool calls concurrently with its receive loop"""
+    def __init__(self, registry: ToolRegistry, max_concurrent=MAX_CONCURRENT_TOOLS):
+        self.registry = registry
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.tasks = {}             # call id -> task
+        self.latency = {}           # tool name -> LatencyStats
+        self.errors = 0
+        self.timeouts = 0
+
+    def dispatch(self, session, tool_call, on_sent=None):
+        """Schedule every function call in a tool_call message; returns immediately"""
+        calls = tool_call.function_calls or []
+        tasks = []
+        for call in calls:
+            task = asyncio.create_task(self._run_one(call))
+            self.tasks[call.id] = task
+            # Runs however the call ends: finished, failed or cancelled
+            task.add_done_callback(lambda t, call_id=call.id: self._forget(call_id, t))
+            tasks.append(task)
+        return asyncio.create_task(self._respond(session, calls, tasks, on_sent))
+
+    def _forget(self, call_id, task):
+        if self.tasks.get(call_id) is task:
+            del self.tasks[call_id]
+
+    def cancel(self, ids):
+        """Cancel single calls; their siblings still run and get answered"""
+        for call_id in ids or []:
+            task = self.tasks.pop(call_id, None)
+            if task is not None:
+                task.cancel()
+
+    async def _respond(self, session, calls, tasks, on_sent=None):
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        # Cancelled calls are not answered: the model already withdrew them
+        responses = [r for r in outcomes if not isinstance(r, BaseException)]
+        if not responses:
+            return
+        try:
+            await session.send_tool_response(function_responses=responses)
+            if on_sent:
+                on_sent()
+        except Exception as e:
+            print(f"Error sending tool response: {e}")
+
+    async def _run_one(self, call):
+        entry = self.registry.tools.get(call.name)
+        start = time.perf_counter()
+        try:
+            if entry is None:
+                raise ValueError(f"unknown tool {call.name}")
+            fn, timeout = entry
+            args = dict(call.args or {})
+            async with self.semaphore:
+                if inspect.iscoroutinefunction(fn):
+                    result = await asyncio.wait_for(fn(**args), timeout)
+                else:
+                    loop = asyncio.get_running_loop()
+                    result = await asyncio.wait_for(loop.run_in_executor(tool_pool, lambda: fn(**args)), timeout)
+            response = {"result": result}
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            response = {"error": f"{call.name} timed out"}
+        except Exception as e:
+            self.errors += 1
+            response = {"error": str(e)}
+        elapsed = time.perf_counter() - start
+        self.latency.setdefault(call.name, LatencyStats()).add(elapsed)
+        print(f"🛠️ Tool {call.name} finished in {elapsed * 1000:.0f} ms")
+        return {"id": call.id, "name": call.name, "response": response}
+
+    def stats(self) -> dict:
+        return {
+            "tools": {name: s.as_dict() for name, s in self.latency.items()},
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "in_flight": len(self.tasks),
+        }
@@ -0,0 +1,292 @@
+# uplink.py
+"""
+Node-wide scheduler for upstream sends to Gemini.
+
+Every SessionManager owns its own Live connection, but they all share the
+node's uplink. Without coordination a few screen-sharing sessions pushing
+large frames fill the uplink and add delay to everyone's audio.
+
+All sessions in the process go through one UplinkScheduler:
+
+  - audio is never held back. Its bytes are charged to the shared budget
+    first, and video is not released while any audio send is in flight
+    (up to AUDIO_YIELD, so video cannot starve completely)
+  - video frames wait for a grant. Grants go round robin over tenants by
+    deficit round robin (quantum x tenant weight, in bytes), so a tenant
+    sending huge frames gets the same byte share as one sending small ones
+  - a token bucket caps total upstream bytes/s (audio + video); 0 = no cap
+  - at most VIDEO_IN_FLIGHT frames are being sent at once, so audio never
+    queues behind more than that many frames in the kernel's socket buffers
+  - a frame that waits longer than MAX_VIDEO_WAIT is dropped (a newer one
+    is already queued behind it)
+
+Queueing delay (queued in the session -> granted) and send time (granted
+-> Live send returned) are tracked per class, so /stats shows whether video
+is hurting voice.
+
+Configuration (per process; cluster.py splits UPLINK_BPS across workers):
+    UPLINK_BPS             total upstream cap in bytes/s, default 0 (no cap)
+    UPLINK_TENANT_WEIGHTS  e.g. "acme=2,free=0.5"; unknown tenants weigh 1
+"""
+import asyncio
+import contextlib
+import os
+import time
+from collections import deque
+
+from tools import LatencyStats
+
+QUANTUM = 64 * 1024         # bytes of video credit per tenant per round
+BURST_SECONDS = 0.1         # token bucket depth, in seconds of UPLINK_BPS
+MAX_VIDEO_WAIT = 2.0        # seconds before a waiting frame is dropped
+AUDIO_YIELD = 0.02          # max seconds video waits for in-flight audio
+VIDEO_IN_FLIGHT = 2         # frames granted but not yet sent, node-wide
+
+
+def parse_weights(spec: str) -> dict:
+    weights = {}
+    for item in (spec or "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            weights[name.strip()] = float(value)
+    return weights
+
+
+class TokenBucket:
+    """Byte budget refilled at `rate` per second; rate 0 means unlimited"""
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst or rate * BURST_SECONDS
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, n: int):
+        """Charge n bytes unconditionally; debt is capped at one burst"""
+        if self.rate:
+            self._refill()
+            self.tokens = max(-self.burst, self.tokens - n)
+
+    def delay_for(self, n: int) -> float:
+        """Seconds until n bytes fit (frames bigger than a burst go once it is full)"""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        n = min(n, self.burst)
+        return 0.0 if self.tokens >= n else (n - self.tokens) / self.rate
+
+
+class VideoGrant:
+    __slots__ = ("tenant", "size", "requested", "granted", "future")
+
+    def __init__(self, tenant, size, future, requested=None):
+        self.tenant = tenant
+        self.size = size
+        self.requested = requested or time.perf_counter()
+        self.granted = None
+        self.future = future
+
+
+class Tenant:
+    __slots__ = ("name", "weight", "queue", "deficit", "video_bytes", "audio_bytes", "dropped")
+
+    def __init__(self, name, weight):
+        self.name = name
+        self.weight = weight
+        self.queue = deque()        # pending VideoGrants, FIFO
+        self.deficit = 0.0
+        self.video_bytes = 0
+        self.audio_bytes = 0
+        self.dropped = 0
+
+
+class UplinkScheduler:
+    def __init__(self, rate: float = 0, weights: dict = None, quantum: int = QUANTUM,
+                 max_video_wait: float = MAX_VIDEO_WAIT, video_in_flight: int = VIDEO_IN_FLIGHT):
+        self.bucket = TokenBucket(rate)
+        self.weights = weights or {}
+        self.quantum = quantum
+        self.max_video_wait = max_video_wait
+        self.tenants = {}
+        self.active = deque()       # tenants with queued video, in DRR order
+        self.audio_in_flight = 0
+        self.video_in_flight = 0
+        self.max_video_in_flight = video_in_flight
+        self.wait = {"audio": LatencyStats(), "video": LatencyStats()}
+        self.send = {"audio": LatencyStats(), "video": LatencyStats()}
+        self.bytes = {"audio": 0, "video": 0}
+        self.dropped = 0
+        self._wakeup = None
+        self._audio_idle = None
+        self._video_slot = None
+        self._task = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            rate=float(os.environ.get("UPLINK_BPS", 0) or 0),
+            weights=parse_weights(os.environ.get("UPLINK_TENANT_WEIGHTS", "")),
+        )
+
+    def tenant(self, name) -> Tenant:
+        tenant = self.tenants.get(name)
+        if tenant is None:
+            # A zero weight would never earn credit and stall the round
+            tenant = self.tenants[name] = Tenant(name, max(self.weights.get(name, 1.0), 0.01))
+        return tenant
+
+    def forget(self, name):
+        """Drop a tenant's counters once its last session is gone"""
+        tenant = self.tenants.get(name)
+        if tenant is not None and not tenant.queue:
+            del self.tenants[name]
+
+    # ------------------------------------------------------------------ audio
+
+    @contextlib.asynccontextmanager
+    async def audio(self, tenant_name, nbytes: int, queued_at: float = None):
+        """Wrap one audio send; never waits. queued_at is its perf_counter() enqueue time"""
+        self.bucket.consume(nbytes)
+        self.audio_in_flight += 1
+        if self._audio_idle is not None:
+            self._audio_idle.clear()
+        start = time.perf_counter()
+        self.wait["audio"].add(start - queued_at if queued_at else 0.0)
+        try:
+            yield
+        finally:
+            self.audio_in_flight -= 1
+            self.send["audio"].add(time.perf_counter() - start)
+            self.bytes["audio"] += nbytes
+            self.tenant(tenant_name).audio_bytes += nbytes
+            if self.audio_in_flight == 0 and self._audio_idle is not None:
+                self._audio_idle.set()
+
+    # ------------------------------------------------------------------ video
+
+    async def acquire_video(self, tenant_name, nbytes: int, queued_at: float = None):
+        """Wait for a video grant; returns it, or None if the frame should be dropped"""
+        self._ensure_dispatcher()
+        tenant = self.tenant(tenant_name)
+        grant = VideoGrant(tenant, nbytes, asyncio.get_running_loop().create_future(), queued_at)
+        tenant.queue.append(grant)
+        if len(tenant.queue) == 1:
+            self.active.append(tenant)
+            self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(grant.future), self.max_video_wait)
+        except asyncio.TimeoutError:
+            if not grant.future.done():
+                grant.future.cancel()
+                tenant.dropped += 1
+                self.dropped += 1
+                return None
+        except asyncio.CancelledError:
+            grant.future.cancel()
+            raise
+        return grant
+
+    def release_video(self, grant: VideoGrant):
+        """Call once the granted frame has been sent"""
+        self.send["video"].add(time.perf_counter() - grant.granted)
+        self.video_in_flight -= 1
+        self._video_slot.set()
+
+    @contextlib.asynccontextmanager
+    async def video(self, tenant_name, nbytes: int, queued_at: float = None):
+        """Yields True with a grant held for the send, False if the frame was dropped"""
+        grant = await self.acquire_video(tenant_name, nbytes, queued_at)
+        try:
+            yield grant is not None
+        finally:
+            if grant is not None:
+                self.release_video(grant)
+
+    def _ensure_dispatcher(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._audio_idle = asyncio.Event()
+            self._video_slot = asyncio.Event()
+            if self.audio_in_flight == 0:
+                self._audio_idle.set()
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def _dispatch(self):
+        while True:
+            if not self.active:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            tenant = self.active[0]
+            tenant.deficit += self.quantum * tenant.weight
+            while tenant.queue:
+                grant = tenant.queue[0]
+                if grant.future.done():         # timed out or cancelled while queued
+                    tenant.queue.popleft()
+                    continue
+                if grant.size > tenant.deficit:
+                    break
+                await self._wait_for_budget(grant.size)
+                tenant.queue.popleft()
+                if grant.future.done():
+                    continue
+                tenant.deficit -= grant.size
+                self.video_in_flight += 1
+                self.bucket.consume(grant.size)
+                grant.granted = time.perf_counter()
+                self.wait["video"].add(grant.granted - grant.requested)
+                self.bytes["video"] += grant.size
+                tenant.video_bytes += grant.size
+                grant.future.set_result(True)
+
+            self.active.popleft()
+            if tenant.queue:
+                self.active.append(tenant)
+            else:
+                tenant.deficit = 0.0
+
+    async def _wait_for_budget(self, nbytes):
+        while self.video_in_flight >= self.max_video_in_flight:
+            self._video_slot.clear()
+            await self._video_slot.wait()
+        # Audio first: let in-flight audio sends finish before releasing video
+        if self.audio_in_flight:
+            try:
+                await asyncio.wait_for(self._audio_idle.wait(), AUDIO_YIELD)
+            except asyncio.TimeoutError:
+                pass
+        while (delay := self.bucket.delay_for(nbytes)) > 0:
+            await asyncio.sleep(delay)
+
+    # ------------------------------------------------------------------ stats
+
+    def stats(self) -> dict:
+        return {
+            "rate_bps": self.bucket.rate,
+            "bytes": dict(self.bytes),
+            "wait": {cls: s.as_dict() for cls, s in self.wait.items()},
+            "send": {cls: s.as_dict() for cls, s in self.send.items()},
+            "video_dropped": self.dropped,
+            "video_queued": sum(len(t.queue) for t in self.tenants.values()),
+            "tenants": {
+                t.name: {"weight": t.weight, "audio_bytes": t.audio_bytes,
+                         "video_bytes": t.video_bytes, "dropped": t.dropped}
+                for t in self.tenants.values()
+            },
+        }
+
+
+# One scheduler per process, shared by every session
+_scheduler = None
+
+
+def get_scheduler() -> UplinkScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = UplinkScheduler.from_env()
+    return _scheduler
@@ -0,0 +1,74 @@
+# usage.py
+"""
+Token accounting from Live API usage metadata.
+
+The Live session attaches `usage_metadata` to server messages. Each one is
+folded into a UsageCounters per session: plain integer totals for prompt,
+response, cached, thinking and tool-use tokens, plus a per-modality split
+(audio / image / video / text) of prompt and response tokens. The prompt
+count of the latest report is the current context size, which is what the
+compression thresholds in gemini_client act on.
+"""
+
+MODALITIES = ("audio", "image", "video", "text")
+
+COUNTERS = (
+    "prompt", "response", "cached", "thoughts", "tool_use", "total",
+    *(f"prompt_{m}" for m in MODALITIES),
+    *(f"response_{m}" for m in MODALITIES),
+)
+
+
+def _modality(entry) -> str:
+    modality = getattr(entry, "modality", None)
+    return str(getattr(modality, "value", modality) or "").lower()
+
+
+class UsageCounters:
+    """Running token totals for one session"""
+    def __init__(self):
+        self.reports = 0
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.context_tokens = 0         # prompt size of the latest report
+        self.max_context_tokens = 0
+
+    def add(self, usage):
+        """Fold one usage_metadata object into the totals"""
+        counts = self.counts
+        self.reports += 1
+        prompt = usage.prompt_token_count or 0
+        counts["prompt"] += prompt
+        counts["response"] += usage.response_token_count or 0
+        counts["cached"] += usage.cached_content_token_count or 0
+        counts["thoughts"] += usage.thoughts_token_count or 0
+        counts["tool_use"] += usage.tool_use_prompt_token_count or 0
+        counts["total"] += usage.total_token_count or 0
+        for prefix, details in (("prompt", usage.prompt_tokens_details),
+                                ("response", usage.response_tokens_details)):
+            for entry in details or ():
+                key = f"{prefix}_{_modality(entry)}"
+                if key in counts:
+                    counts[key] += entry.token_count or 0
+        if prompt:
+            self.context_tokens = prompt
+            self.max_context_tokens = max(self.max_context_tokens, prompt)
+
+    def as_dict(self) -> dict:
+        return {
+            "reports": self.reports,
+            **self.counts,
+            "context_tokens": self.context_tokens,
+            "max_context_tokens": self.max_context_tokens,
+        }
+
+
+def add_usage(total: dict, usage: dict) -> dict:
+    """Aggregate UsageCounters.as_dict() snapshots: sums, except context sizes take the max"""
+    for key, value in usage.items():
+        if not isinstance(value, (int, float)):
+            continue
+        if key.endswith("context_tokens"):
+            total[key] = max(total.get(key, 0), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
@@ -1,82 +1,202 @@
 # video.py
 import asyncio, io, base64
-import cv2, mss
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import PIL.Image
 
 class VideoHandler:
+    """Video state of one session; local capture lives in pipeline.CameraSource / ScreenSource"""
     def __init__(self, mode="none"):
         self.video_mode = mode
         self.out_queue = None
 
-    def _get_frame(self, cap):
-        # Read the frameq
-        ret, frame = cap.read()
-        # Check if the frame was read successfully
-        if not ret:
-            return None
-        # Fix: Convert BGR to RGB color space
-        # OpenCV captures in BGR but PIL expects RGB format
-        # This prevents the blue tint in the video feed
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        img = PIL.Image.fromarray(frame_rgb)  # Now using RGB frame
-        img.thumbnail([1024, 1024])
 
-        image_io = io.BytesIO()
-        img.save(image_io, format="jpeg")
-        image_io.seek(0)
-
-        mime_type = "image/jpeg"
-        image_bytes = image_io.read()
-        return {"mime_type": mime_type, "data": base64.b64encode(image_bytes).decode()}
-    
-    async def get_frames(self):
-        # This takes about a second, and will block the whole program
-        # causing the audio pipeline to overflow if you don't to_thread it.
-        cap = await asyncio.to_thread(
-            cv2.VideoCapture, 0
-        )  # 0 represents the default camera
-
-        while True:
-            frame = await asyncio.to_thread(self._get_frame, cap)
-            if frame is None:
-                break
-
-            await asyncio.sleep(1.0)
-
-            await self.out_queue.put(frame) if self.out_queue else None
-
-        # Release the VideoCapture object
-        cap.release()
-
-    def _get_screen(self):
-        sct = mss.mss()
-        monitor = sct.monitors[0]
-
-        i = sct.grab(monitor)
-
-        mime_type = "image/jpeg"
-        image_bytes = mss.tools.to_png(i.rgb, i.size)
-        img = PIL.Image.open(io.BytesIO(image_bytes))
-        # img.save("screenshot_debug.jpg")
-
-        image_io = io.BytesIO()
-        img.save(image_io, format="jpeg")
-        image_io.seek(0)
-
-        image_bytes = image_io.read()
-        return {"mime_type": mime_type, "data": base64.b64encode(image_bytes).decode()}
-
-    async def get_screen(self):
-
-        while True:
-            frame = await asyncio.to_thread(self._get_screen)
-            if frame is None:
-                break
-
-            await asyncio.sleep(1.0)
-
-            await self.out_queue.put(frame) if self.out_queue else None
-
-
-            # If you interrupt the model, it sends a turn_complete.
-            # For interruptions to work, we need to stop playback.
\ No newline at end of file
+def capture_camera_frame(cap):
+    """Blocking: one JPEG blob from an open cv2.VideoCapture, or None when it stops"""
+    import cv2
+
+    # Read the frame
+    ret, frame = cap.read()
+    # Check if the frame was read successfully
+    if not ret:
+        return None
+    # Fix: Convert BGR to RGB color space
+    # OpenCV captures in BGR but PIL expects RGB format
+    # This prevents the blue tint in the video feed
+    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    img = PIL.Image.fromarray(frame_rgb)  # Now using RGB frame
+    img.thumbnail([1024, 1024])
+
+    image_io = io.BytesIO()
+    img.save(image_io, format="jpeg")
+    image_io.seek(0)
+
+    mime_type = "image/jpeg"
+    image_bytes = image_io.read()
+    return {"mime_type": mime_type, "data": base64.b64encode(image_bytes).decode()}
+
+
+def capture_screen():
+    """Blocking: one JPEG blob of the whole screen"""
+    import mss
+    import mss.tools
+
+    sct = mss.mss()
+    monitor = sct.monitors[0]
+
+    i = sct.grab(monitor)
+
+    mime_type = "image/jpeg"
+    image_bytes = mss.tools.to_png(i.rgb, i.size)
+    img = PIL.Image.open(io.BytesIO(image_bytes))
+
+    image_io = io.BytesIO()
+    img.save(image_io, format="jpeg")
+    image_io.seek(0)
+
+    image_bytes = image_io.read()
+    return {"mime_type": mime_type, "data": base64.b64encode(image_bytes).decode()}
+
+# ---------------------------------------------------------------------------
+# Speech-aligned frame selection (camera mode)
+#
+# The model mostly needs to see what the user is looking at while they talk.
+# FrameSelector keeps a small ring of recent frames, each scored for
+# sharpness (variance of the Laplacian of a small grayscale decode), and
+# decides which ones go upstream:
+#   onset    at speech start: the sharpest frame of the last PRE_ROLL seconds
+#   speech   while talking: the sharpest new frame every SPEECH_INTERVAL
+#   end      at speech end: the sharpest frame not yet sent since the last one
+#   scene    while quiet: a frame that differs clearly from the last one sent
+#   keyframe while quiet: the sharpest new frame every KEYFRAME_INTERVAL
+# Everything else is dropped on the server.
+
+RING_SIZE = 8
+PRE_ROLL = 1.5              # seconds before speech onset worth showing
+SPEECH_INTERVAL = 1.0
+KEYFRAME_INTERVAL = 10.0
+SCENE_THRESHOLD = 20.0      # mean abs difference of 32x24 thumbnails, 0..255
+SCENE_MIN_INTERVAL = 2.0
+SCORE_SIZE = (160, 120)
+TOKENS_PER_FRAME = 258      # Gemini image tokens at low media resolution
+
+# Decoding and scoring run here, never on the event loop
+score_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="frames")
+
+
+def score_jpeg(jpeg: bytes):
+    """(sharpness, 32x24 thumbnail) of an encoded image"""
+    img = PIL.Image.open(io.BytesIO(jpeg))
+    img.draft("L", SCORE_SIZE)  # JPEG: decode at 1/2..1/8 scale straight to grayscale
+    g = np.asarray(img.convert("L").resize(SCORE_SIZE, PIL.Image.BILINEAR), dtype=np.float32)
+    lap = g[:-2, 1:-1] + g[2:, 1:-1] + g[1:-1, :-2] + g[1:-1, 2:] - 4.0 * g[1:-1, 1:-1]
+    return float(lap.var()), g[::5, ::5].copy()
+
+
+def _score_b64(data: str):
+    return score_jpeg(base64.b64decode(data))
+
+
+class _Entry:
+    __slots__ = ("t", "score", "thumb", "frame", "sent")
+
+    def __init__(self, t, score, thumb, frame):
+        self.t = t
+        self.score = score
+        self.thumb = thumb
+        self.frame = frame
+        self.sent = False
+
+
+class FrameSelector:
+    def __init__(self, ring_size=RING_SIZE):
+        self.ring = deque(maxlen=ring_size)
+        self.speaking = False
+        self.last_sent = None       # _Entry most recently forwarded
+        self.last_sent_at = float("-inf")
+        self.want_next = False      # speech started with no recent frame: take the next one
+
+        self.received = 0
+        self.forwarded = {"onset": 0, "speech": 0, "end": 0, "scene": 0, "keyframe": 0}
+        self.errors = 0
+        self.score_time = 0.0
+
+    async def add(self, frame, now=None):
+        """Score a frame (codec.MediaFrame or blob dict); returns the frames to send now"""
+        now = time.monotonic() if now is None else now
+        self.received += 1
+        data = frame["data"] if isinstance(frame, dict) else frame.data
+        start = time.perf_counter()
+        try:
+            score, thumb = await asyncio.get_running_loop().run_in_executor(score_pool, _score_b64, data)
+        except Exception as e:
+            # Undecodable frame: don't judge it, just treat it as blurry
+            self.errors += 1
+            if self.errors == 1:
+                print(f"⚠️ Frame scoring failed: {e}")
+            score, thumb = 0.0, None
+        self.score_time += time.perf_counter() - start
+
+        entry = _Entry(now, score, thumb, frame)
+        self.ring.append(entry)
+
+        if self.want_next:
+            self.want_next = False
+            return self._send(entry, "onset", now)
+        if self.speaking:
+            if now - self.last_sent_at >= SPEECH_INTERVAL:
+                return self._send(self._best(self.last_sent_at), "speech", now)
+            return []
+        if now - self.last_sent_at >= SCENE_MIN_INTERVAL and self._scene_changed(entry):
+            return self._send(entry, "scene", now)
+        if now - self.last_sent_at >= KEYFRAME_INTERVAL:
+            return self._send(self._best(self.last_sent_at), "keyframe", now)
+        return []
+
+    def speech_start(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.speaking = True
+        best = self._best(now - PRE_ROLL)
+        if best is None:
+            self.want_next = True
+            return []
+        return self._send(best, "onset", now)
+
+    def speech_end(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.speaking = False
+        self.want_next = False
+        return self._send(self._best(self.last_sent_at), "end", now)
+
+    def _best(self, since):
+        candidates = [e for e in self.ring if e.t > since and not e.sent]
+        return max(candidates, key=lambda e: e.score) if candidates else None
+
+    def _scene_changed(self, entry):
+        last = self.last_sent
+        if last is None or last.thumb is None or entry.thumb is None:
+            return last is None
+        return float(np.abs(entry.thumb - last.thumb).mean()) > SCENE_THRESHOLD
+
+    def _send(self, entry, reason, now):
+        if entry is None:
+            return []
+        entry.sent = True
+        self.last_sent = entry
+        self.last_sent_at = now
+        self.forwarded[reason] += 1
+        return [entry.frame]
+
+    def stats(self) -> dict:
+        sent = sum(self.forwarded.values())
+        return {
+            "received": self.received,
+            "forwarded": sent,
+            "by_reason": dict(self.forwarded),
+            "dropped": self.received - sent,
+            "image_tokens_saved": (self.received - sent) * TOKENS_PER_FRAME,
+            "score_ms_avg": round(self.score_time / self.received * 1000, 2) if self.received else 0.0,
+            "errors": self.errors,
+        }